@@ -0,0 +1,141 @@
+import React, { useMemo } from "react";
+
+interface EncodedSegment {
+  x: string;
+  y: string;
+  n: number;
+}
+
+export interface PlotFunctionData {
+  expression: string;
+  derivativeExpression?: string;
+  domain: [number, number];
+  yRange: [number, number];
+  f: EncodedSegment[];
+  df?: EncodedSegment[];
+  tangent?: { x0: number; y0: number; slope: number };
+  area?: EncodedSegment & { value: number };
+}
+
+interface PlotFunctionProps {
+  data: PlotFunctionData | null;
+  // shown in the placeholder when the server could not sample the function
+  expression?: string;
+  width?: number;
+  height?: number;
+}
+
+// the reasoning server sends samples as base64 little-endian float32 arrays
+const decode = (encoded: string): Float32Array => {
+  const binary = atob(encoded);
+  const bytes = new Uint8Array(binary.length);
+  for (let i = 0; i < binary.length; i++) {
+    bytes[i] = binary.charCodeAt(i);
+  }
+  return new Float32Array(bytes.buffer);
+};
+
+export const PlotFunction: React.FC<PlotFunctionProps> = ({
+  data,
+  expression,
+  width = 600,
+  height = 400
+}) => {
+  const paths = useMemo(() => {
+    if (!data) {
+      return null;
+    }
+    const [xMin, xMax] = data.domain;
+    const [yMin, yMax] = data.yRange;
+    const sx = (x: number) => ((x - xMin) / (xMax - xMin)) * width;
+    const sy = (y: number) => height - ((y - yMin) / (yMax - yMin)) * height;
+
+    const toPath = (segments: EncodedSegment[] = []) =>
+      segments
+        .map((segment) => {
+          const xs = decode(segment.x);
+          const ys = decode(segment.y);
+          let d = "";
+          for (let i = 0; i < segment.n; i++) {
+            d += `${i === 0 ? "M" : "L"}${sx(xs[i]).toFixed(1)},${sy(ys[i]).toFixed(1)}`;
+          }
+          return d;
+        })
+        .join("");
+
+    let area = "";
+    if (data.area) {
+      const xs = decode(data.area.x);
+      const ys = decode(data.area.y);
+      area = `M${sx(xs[0]).toFixed(1)},${sy(0).toFixed(1)}`;
+      for (let i = 0; i < data.area.n; i++) {
+        area += `L${sx(xs[i]).toFixed(1)},${sy(ys[i]).toFixed(1)}`;
+      }
+      area += `L${sx(xs[data.area.n - 1]).toFixed(1)},${sy(0).toFixed(1)}Z`;
+    }
+
+    let tangent = "";
+    if (data.tangent) {
+      const { x0, y0, slope } = data.tangent;
+      tangent = `M${sx(xMin)},${sy(y0 + slope * (xMin - x0))}L${sx(xMax)},${sy(y0 + slope * (xMax - x0))}`;
+    }
+
+    return {
+      f: toPath(data.f),
+      df: toPath(data.df),
+      area,
+      tangent,
+      xAxis: yMin <= 0 && yMax >= 0 ? sy(0) : null,
+      yAxis: xMin <= 0 && xMax >= 0 ? sx(0) : null
+    };
+  }, [data, width, height]);
+
+  if (!data || !paths) {
+    return (
+      <div
+        className="flex items-center justify-center my-4 border border-dashed border-gray-400 text-sm text-gray-500"
+        style={{ width, height: height / 4, maxWidth: "100%" }}
+      >
+        {expression ? `Plot of f(x) = ${expression} is unavailable` : "Plot unavailable"}
+      </div>
+    );
+  }
+
+  return (
+    <div className="flex flex-col items-center my-4">
+      <svg
+        viewBox={`0 0 ${width} ${height}`}
+        width={width}
+        height={height}
+        className="max-w-full"
+      >
+        <defs>
+          <clipPath id="plot-clip">
+            <rect x={0} y={0} width={width} height={height} />
+          </clipPath>
+        </defs>
+        <g clipPath="url(#plot-clip)">
+          {paths.xAxis !== null && (
+            <line x1={0} x2={width} y1={paths.xAxis} y2={paths.xAxis} stroke="#bbb" />
+          )}
+          {paths.yAxis !== null && (
+            <line x1={paths.yAxis} x2={paths.yAxis} y1={0} y2={height} stroke="#bbb" />
+          )}
+          {paths.area && <path d={paths.area} fill="#F15950" fillOpacity={0.2} />}
+          {paths.df && (
+            <path d={paths.df} fill="none" stroke="#3b82f6" strokeWidth={2} strokeDasharray="6 4" />
+          )}
+          <path d={paths.f} fill="none" stroke="#F15950" strokeWidth={2.5} />
+          {paths.tangent && (
+            <path d={paths.tangent} fill="none" stroke="#10b981" strokeWidth={1.5} />
+          )}
+        </g>
+      </svg>
+      <div className="text-sm mt-2">
+        f(x) = {data.expression}
+        {data.derivativeExpression && <span>, f&apos;(x) = {data.derivativeExpression}</span>}
+        {data.area && <span>, area = {data.area.value.toFixed(4)}</span>}
+      </div>
+    </div>
+  );
+};
@@ -13,6 +13,7 @@ import { SyncLoader, PulseLoader, ScaleLoader } from "react-spinners";
 import { Header } from "./components/header";
 import { IntroPopup } from "./components/intro-popup";
 import { MarkdownLatex } from "./components/markdown-latex";
+import { PlotFunction } from "./components/plot-function";
 
 import xRxClient from "../../../xrx-core/react-xrx-client/src";
 
@@ -174,6 +175,12 @@ export default function Home() {
                   <MarkdownLatex content={parameters.content}></MarkdownLatex>
               </div>
             );
+          case 'plotFunction':
+            return (
+              <div key={`widget-${index}`} className="flex items-center justify-center min-w-[60%]">
+                  <PlotFunction data={data} expression={parameters?.expression}></PlotFunction>
+              </div>
+            );
           default:
             return null;
         }
@@ -0,0 +1,48 @@
+import os
+import re
+from typing import List, Optional
+
+from .prompts import detect_topic
+
+EARLY_ACKNOWLEDGEMENT = os.getenv("EARLY_ACKNOWLEDGEMENT", "true").lower() == "true"
+
+# A fixed phrase set, so the TTS provider (and any cache in front of it) sees the same few strings every time
+ACKNOWLEDGEMENTS = [
+    "Sure, let me work that out.",
+    "Okay, give me a second to work through that.",
+    "Good question, let me solve that for you.",
+]
+
+HEAVY_REQUEST = re.compile(
+    r"\b(solve|integra\w*|antiderivative|derivative|differentiat\w*|limit|series|taylor|"
+    r"step[- ]by[- ]step|work (it|this|that) out|show (me )?(the )?(work|steps|solution))\b",
+    re.IGNORECASE,
+)
+MATH_CONTENT = re.compile(r"(\d|\bx\b|[\^*/=+]|\b(sin|cos|tan|exp|log|ln|sqrt)\b)", re.IGNORECASE)
+
+
+def classify_turn(messages: List[dict]) -> Optional[str]:
+    """
+    Returns the topic of the turn if it will need a calculation and a full whiteboard, otherwise None.
+    Uses only the latest user message, so it costs no LLM call.
+    """
+    if not EARLY_ACKNOWLEDGEMENT or not messages or messages[-1].get("role") != "user":
+        return None
+    text = messages[-1].get("content") or ""
+    if not HEAVY_REQUEST.search(text) or not MATH_CONTENT.search(text):
+        return None
+    return detect_topic(text) or "Solution"
+
+
+def acknowledgement(messages: List[dict]) -> str:
+    # rotate through the phrase set by turn so it does not sound repetitive
+    return ACKNOWLEDGEMENTS[len(messages) % len(ACKNOWLEDGEMENTS)]
+
+
+def skeleton_whiteboard(topic: str) -> list:
+    return [
+        {
+            "type": "defineWhiteboard",
+            "parameters": {"content": f"### {topic}\n\n---\n\n*Working it out...*"},
+        }
+    ]
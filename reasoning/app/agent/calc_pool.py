@@ -0,0 +1,184 @@
+import asyncio
+import json
+import logging
+import math
+import os
+import signal
+import time
+import uuid
+
+import redis
+
+from .recorder import new_turn_record, record_event, turn_record_var
+from .utils.calculator import process_calc_solve
+from .utils.plotter import render_plot_widgets
+
+# Heavy work (SymPy calculations, plot sampling) is queued on a Redis list served by a pool of
+# calculation processes shared by all workers, so it is picked up by whichever calculation
+# process is free instead of waiting behind a long integration on the worker that received the
+# turn. The gunicorn master starts the pool (see gunicorn.conf.py); without it, for example when
+# running uvicorn directly or during replay, the work runs on a thread of the worker.
+
+POOL_ENV = "REASONING_CALC_POOL"
+JOBS_KEY = "calc:jobs"
+RESULT_KEY = "calc:result:{job_id}"
+# How long a turn waits for heavy work to start and finish before going on without it
+HEAVY_TIMEOUT_SECONDS = float(os.getenv("REASONING_HEAVY_TIMEOUT_SECONDS", 20))
+# Without the pool, the number of concurrent calculations per worker, since they compete for the same core
+heavy_slots = asyncio.Semaphore(int(os.getenv("REASONING_HEAVY_CONCURRENCY", 1)))
+
+TASKS = {
+    "calc_solve": process_calc_solve,
+    "plot": render_plot_widgets,
+}
+
+
+class HeavyWorkTimeout(Exception):
+    pass
+
+
+async def run_heavy(redis_client, task: str, argument):
+    """
+    Runs a heavy task in the shared calculation pool, or on a worker thread when there is no pool.
+    Raises HeavyWorkTimeout if it does not complete within HEAVY_TIMEOUT_SECONDS.
+    """
+    if os.getenv(POOL_ENV) == "true":
+        try:
+            return await _run_in_pool(redis_client, task, argument)
+        except redis.RedisError as e:
+            logging.warning(f"Calculation pool unavailable, running {task} in the worker: {str(e)}")
+
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + HEAVY_TIMEOUT_SECONDS
+    try:
+        await asyncio.wait_for(heavy_slots.acquire(), HEAVY_TIMEOUT_SECONDS)
+    except asyncio.TimeoutError:
+        raise HeavyWorkTimeout(f"No calculation slot for {task} within {HEAVY_TIMEOUT_SECONDS:g}s")
+    try:
+        # a thread cannot be interrupted: on timeout it finishes in the background, and the slot
+        # is released so that it does not hold up the worker's later turns
+        return await asyncio.wait_for(asyncio.to_thread(TASKS[task], argument), deadline - loop.time())
+    except asyncio.TimeoutError:
+        raise HeavyWorkTimeout(f"{task} did not complete within {HEAVY_TIMEOUT_SECONDS:g}s")
+    finally:
+        heavy_slots.release()
+
+
+async def _run_in_pool(redis_client, task: str, argument):
+    job_id = uuid.uuid4().hex
+    job = {"id": job_id, "task": task, "argument": argument, "deadline": time.time() + HEAVY_TIMEOUT_SECONDS}
+    await redis_client.rpush(JOBS_KEY, json.dumps(job))
+    reply = await redis_client.blpop(RESULT_KEY.format(job_id=job_id), timeout=math.ceil(HEAVY_TIMEOUT_SECONDS))
+    if reply is None:
+        raise HeavyWorkTimeout(f"{task} did not complete in the calculation pool within {HEAVY_TIMEOUT_SECONDS:g}s")
+
+    reply = json.loads(reply[1])
+    # events recorded in the calculation process belong to this turn's record
+    for event in reply["calc_solve"]:
+        record_event("calc_solve", event)
+    if "error" in reply:
+        raise RuntimeError(reply["error"])
+    return reply["result"]
+
+
+def _serve():
+    """
+    Runs in a calculation process: takes jobs from the shared queue until it is stopped or its
+    supervisor goes away.
+    """
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    # a job still running at its deadline (the turn has gone on without it) ends the process,
+    # since its batch threads cannot be interrupted; the supervisor starts a new one
+    signal.signal(signal.SIGALRM, signal.SIG_DFL)
+    supervisor = os.getppid()
+    client = redis.Redis(host=os.getenv("REDIS_HOST", "localhost"), port=6379, db=0)
+    while os.getppid() == supervisor:
+        try:
+            popped = client.blpop(JOBS_KEY, timeout=5)
+        except redis.RedisError as e:
+            logging.warning(f"Calculation pool cannot reach Redis: {str(e)}")
+            time.sleep(1)
+            continue
+        if popped is None:
+            continue
+
+        job = json.loads(popped[1])
+        if time.time() > job["deadline"]:
+            # the turn has already gone on without it
+            continue
+
+        record = new_turn_record([], {}, "")
+        token = turn_record_var.set(record)
+        reply = {}
+        signal.setitimer(signal.ITIMER_REAL, max(job["deadline"] - time.time(), 0.01))
+        try:
+            reply["result"] = TASKS[job["task"]](job["argument"])
+        except Exception as e:
+            logging.exception(f"Error running {job['task']} in the calculation pool")
+            reply["error"] = str(e)
+        finally:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+            turn_record_var.reset(token)
+        reply["calc_solve"] = record["calc_solve"]
+
+        key = RESULT_KEY.format(job_id=job["id"])
+        try:
+            client.pipeline().rpush(key, json.dumps(reply, default=str)).expire(key, 60).execute()
+        except redis.RedisError as e:
+            logging.warning(f"Calculation pool cannot return a result: {str(e)}")
+
+
+def _fork(target) -> int:
+    pid = os.fork()
+    if pid == 0:
+        code = 0
+        try:
+            target()
+        except BaseException:
+            logging.exception("Calculation pool process failed")
+            code = 1
+        finally:
+            os._exit(code)
+    return pid
+
+
+def _supervise(processes: int):
+    """
+    Keeps the calculation processes running, and stops them when stopped or when the master exits.
+    """
+    # the gunicorn master's handlers and wakeup pipe are inherited across fork
+    signal.set_wakeup_fd(-1)
+    for sig in (signal.SIGHUP, signal.SIGQUIT, signal.SIGINT, signal.SIGTTIN, signal.SIGTTOU,
+                signal.SIGUSR1, signal.SIGUSR2, signal.SIGWINCH, signal.SIGCHLD):
+        signal.signal(sig, signal.SIG_DFL)
+    stopping = []
+    signal.signal(signal.SIGTERM, lambda *_: stopping.append(True))
+
+    master = os.getppid()
+    children = set()
+    while not stopping and os.getppid() == master:
+        while len(children) < processes:
+            children.add(_fork(_serve))
+        time.sleep(1)
+        while children:
+            pid, status = os.waitpid(-1, os.WNOHANG)
+            if pid == 0:
+                break
+            children.discard(pid)
+            if os.WIFSIGNALED(status) and os.WTERMSIG(status) == signal.SIGALRM:
+                logging.warning(f"Calculation process {pid} ran past a job's deadline, restarting it")
+            else:
+                logging.warning(f"Calculation process {pid} exited with status {status}, restarting it")
+
+    for pid in children:
+        os.kill(pid, signal.SIGTERM)
+
+
+def start_pool(processes: int) -> int:
+    """
+    Starts the calculation pool from the gunicorn master, before the workers are forked so that
+    they inherit the setting that routes heavy work to it. Returns the supervisor's pid.
+    """
+    pid = _fork(lambda: _supervise(processes))
+    os.environ[POOL_ENV] = "true"
+    return pid
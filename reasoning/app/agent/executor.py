@@ -1,17 +1,23 @@
 from typing import List
+import asyncio
 import json
 import os
 import logging
 import redis
 import copy
+import time
 
 from agent_framework.xrx_agent_framework import observability_decorator
 from agent_framework.xrx_agent_framework import initialize_llm_client
 from .context_manager import set_session, session_var
-from .utils.calculator import (
-    calc_solve,
-    process_calc_solve
-)
+from .recorder import annotate_turn, record_event, record_timing, record_turn, stage
+from .acknowledgement import acknowledgement, classify_turn, skeleton_whiteboard
+from .structured_logging import configure_logging, log_payload
+from .prompts import compile_context_prompt, compile_tutor_prompt
+from .load import CACHE_ONLY, CAP_TOKENS, SKIP_CONTEXT, SPEECH_ONLY, TIER_NAMES, load_monitor
+from .calc_pool import HeavyWorkTimeout, run_heavy
+from .utils.latex import normalize_widgets
+from .utils.cache import cache_key, get_cached, set_cached
 
 
 # set up the redis client
@@ -22,199 +28,25 @@ redis_client = redis.asyncio.Redis(host=redis_host, port=6379, db=0)
 client = initialize_llm_client()
 MODEL = os.environ["LLM_MODEL_ID"]
 
-logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s:%(message)s")
-
-SYSTEM_PROMPT = """You are a calculus tutor that helps students. You can show live interfaces to the user of mathematic equations as a whiteboard with LaTeX styling.
-
-## Style and Tone
-* You should remain friendly and concise.
-* Roll with the punches while staying on task of getting your required information.
-* Your response will be said out loud as audio to the student, so make sure your response will sound natural when it is spoken.
-* You should sound like a normal person. Do not sound robotic at all.
+configure_logging()
 
-## Interface
-
-1. defineWhiteboard
-   - Description: This tool defines what is currently shown on the whiteboard to the student.
-   - Parameters:
-     - content: String (latex styled content for the whiteboard)
-    - Example:
-        - defineWhiteboard": { "parameters": { "content": "### Definition of a derivative:\n\n$$\\frac{df}{dx} = \\lim_{h \to 0} \\frac{f(x + h) - f(x)}{h}$$" } }
+SPEECH_ONLY_INSTRUCTION = "The service is under heavy load. Respond with speech only: set widgets to an empty list and keep the response short."
+CAP_TOKENS_INSTRUCTION = (
+    "The service is under heavy load and your output is limited to {max_tokens} tokens. Keep the whiteboard "
+    "to the key steps and the response short, so the complete JSON fits."
+)
 
-## Output format
 
-Your response must be perfectly formatted JSON with the following structure
+async def create_completion(**kwargs):
+    """
+    Calls the LLM off the event loop and feeds its latency to the load monitor.
+    """
+    start = time.perf_counter()
+    try:
+        return await asyncio.to_thread(client.chat.completions.create, model=os.environ["LLM_MODEL_ID"], **kwargs)
+    finally:
+        load_monitor.observe_llm_latency((time.perf_counter() - start) * 1000)
 
-{
-    "widgets": [
-        {
-        "type":"defineWhiteboard",
-        "parameters": { "content": "### Definition of a derivative:\n\n$$\\frac{df}{dx} = \\lim_{h \to 0} \\frac{f(x + h) - f(x)}{h}$$" }
-        }
-    ],
-    "response": "your response to the student"
-}
-
-## Example 1
-
-Assistant (you): {
-"widgets": [],
-"response": "Hi! I'm your calculus tutor. I can help explain concepts and work through problems with you using an interactive whiteboard. What would you like to work on today?"
-}
-
-User: Can you explain derivatives?
-
-Assistant (you): {
-"widgets": [
-{
-"type": "defineWhiteboard",
-"parameters": {
-"content": "### Introduction to Derivatives\n\nThe derivative measures instantaneous rate of change. It can be defined as:\n\n$$f'(x) = \\lim_{h \to 0} \\frac{f(x + h) - f(x)}{h}$$\n\nGeometrically, this represents:\n- The slope of the tangent line at any point\n- The instantaneous rate of change\n- The velocity at any moment (when $f(x)$ represents position)\n\nExample: When $f(x) = x^2$, the derivative is:\n$$\\frac{d}{dx}(x^2) = \\lim_{h \to 0} \\frac{(x+h)^2 - x^2}{h} = 2x$$"
-}
-}
-],
-"response": "The derivative measures how quickly a function changes. I've written the formal definition and included both its mathematical and geometric interpretations. Would you like to learn some rules for calculating derivatives?"
-}
-
-User: Yes, show me the power rule
-
-Assistant (you): {
-"widgets": [
-{
-"type": "defineWhiteboard",
-"parameters": {
-"content": "### Derivative Rules\n\n1) Power Rule: For any real number $n$\n$$\\frac{d}{dx}(x^n) = nx^{n-1}$$\n\n2) Constant Multiple Rule:\n$$\\frac{d}{dx}(cf(x)) = c\\frac{d}{dx}f(x)$$\n\nExamples:\n\n$f(x) = x^3 \\implies f'(x) = 3x^2$\n\n$g(x) = 5x^4 \\implies g'(x) = 20x^3$\n\n$h(x) = \pi x^2 \\implies h'(x) = 2\pi x$\n\nTry this: Find $\\frac{d}{dx}(4x^5)$"
-}
-}
-],
-"response": "Here's the power rule along with the constant multiple rule. Notice how we can combine them to find derivatives of terms like 5x^4. Want to try the practice problem I wrote at the bottom?"
-}
-
-User: Let me try. Would it be 20x^4?
-
-Assistant (you): {
-"widgets": 
-[
-{
-"type": "defineWhiteboard",
-"parameters": {
-"content": "### Solution\n\nFor $f(x) = 4x^5$:\n\n$$\begin{align*}\n\\frac{d}{dx}(4x^5) &= 4 \cdot \\frac{d}{dx}(x^5) \quad \text{(Constant Multiple Rule)} \\\n&= 4 \cdot 5x^4 \quad \text{(Power Rule)} \\\n&= 20x^4 \quad ✓\n\end{align*}$$\n\nLet's try a more complex example:\n\nFind $\\frac{d}{dx}(2x^3 + \pi x^2 - \sqrt{x})$\n\nHint: $\sqrt{x} = x^{\\frac{1}{2}}$"
-}
-}
-],
-"response": "Exactly right! I've shown the step-by-step solution using both the constant multiple rule and the power rule. Ready to try a more challenging problem that combines multiple terms?"
-}
-
-## Rules
-* Ask feedback questions if you do not understand what the person was saying
-* Always speak in a human-like manner. Your goal is to sound as little like a robotic voice as possible.
-* Do not ask people for specific formats of information. Ask them like a normal person would.
-* Use markdown formatting as much as possible and reasonable.
-* Use $$ around any latex formatted equations.
-* Use dividers (---) between sections.
-* Make sure to include a response AND whiteboard content with every request.
-* ALWAYS use two backslashs when needed before all latex equations. (i.e. lim should be \\lim, frac should be \\frac)
-"""
-
-CONTEXT_SYSTEM_PROMPT = """
-# Calculator Tool Instructions
-
-You have a symbolic mathematics calculator that can solve various calculus problems. Here's how to use it:
-
-## Basic Function Signature
-```python
-calc_solve(expression, operation='derivative', point=None, terms=None)
-```
-
-## Valid Operations
-- `derivative`: Find the derivative of an expression
-- `integral`: Find the indefinite integral
-- `limit`: Calculate a limit at a point
-- `series`: Generate a series expansion
-
-## Input Format
-- Use standard mathematical notation with Python syntax
-- Variable should be 'x'
-- Use * for multiplication: `2*x` not `2x`
-- Use ** or ^ for powers: `x**2` or `x^2`
-- Functions available: sin, cos, tan, exp, log, sqrt
-
-## Examples
-
-1. Basic Derivatives
-```python
-calc_solve("x^2 + sin(x)")
-calc_solve("exp(x) + 5*x^3")
-```
-
-2. Integrals
-```python
-calc_solve("3*x^2 + 2*x", operation="integral")
-calc_solve("sin(x)*cos(x)", operation="integral")
-```
-
-3. Limits
-```python
-calc_solve("sin(x)/x", operation="limit", point=0)
-calc_solve("(x^2-1)/(x-1)", operation="limit", point=1)
-```
-
-4. Series Expansions
-```python
-calc_solve("exp(x)", operation="series", point=0, terms=4)
-calc_solve("sin(x)", operation="series", point=0, terms=5)
-```
-
-## Common Functions
-- Trigonometric: sin(x), cos(x), tan(x)
-- Exponential: exp(x)
-- Logarithmic: log(x)
-- Square root: sqrt(x)
-
-## Error Cases to Handle
-- Invalid expressions will return error message
-- Missing required parameters for limit/series will return error
-- Invalid operations will return error message
-
-## Example Usage Sequence
-```python
-# Derivative of polynomial
-calc_solve("x^3 + 2*x^2 - 5*x + 3")
-
-# Integral of trigonometric function
-calc_solve("sin(2*x)", operation="integral")
-
-# Limit of rational function
-calc_solve("(x^2-4)/(x-2)", operation="limit", point=2)
-
-# Series expansion of exponential
-calc_solve("exp(x)", operation="series", point=0, terms=4)
-```
-
-Each result includes:
-1. The original expression
-2. Step-by-step solution process
-3. Final result
-4. Verification when applicable
-
-## Common Patterns and Tips
-1. Always check if required parameters are provided for the operation
-2. Use proper Python syntax for mathematical expressions
-
-# Output Instructions
-
-You are gathering context before you provide a response to the student. You are to determine if your response will require a calculation, and if so, perform it. Otherwise, do nothing.
-
-Your response would require a calculation (or multiple) if the student asked for the solution (final or step by step) to a specific problem, or if they asked for a worked out example.
-
-ONLY output "calc_solve(...)", otherwise, no output is required. Do not try to solve without the function. ONLY use calc_solve if you have been ASKED to solve an equation. 
-
-Use calc_solve always when: 
-- You are asked to generate a solution.
-
-Do not use calc_solve when:
-- You are asked to generate a problem.
-"""
 
 @observability_decorator(name="run_agent")
 async def run_agent(input_dict: dict):
@@ -225,12 +57,32 @@ async def run_agent(input_dict: dict):
         session = input_dict["session"]
         task_id = input_dict.get("task_id", "")
 
+        turn_start = time.perf_counter()
+        first_response = None
+
         # Use the context manager to set the session
-        with set_session(session):
-            async for response in single_turn_agent(messages, task_id):
+        with set_session(session), record_turn(messages, session, task_id), stage("total"), load_monitor.turn():
+            tier = load_monitor.tier()
+            annotate_turn("degradation", TIER_NAMES[tier])
+            load_monitor.publish_soon(redis_client)
+            async for response in single_turn_agent(messages, task_id, tier):
                 response["session"] = session_var.get()
-                logging.info(f"Agent Output: {json.dumps(response)}")
-                yield json.dumps(response)
+                response["degradation"] = TIER_NAMES[tier]
+                output = json.dumps(response)
+                log_payload("Agent Output", output)
+                yield output
+
+                # time until the first spoken text leaves the reasoning service; speech synthesis
+                # and playback come on top of it
+                if first_response is None and response["node"] == "CustomerResponse":
+                    first_response = (time.perf_counter() - turn_start) * 1000
+                    record_timing("first_response", first_response)
+
+        if first_response is not None:
+            logging.info(
+                f"Turn latency: first response {first_response:.0f} ms, full turn {(time.perf_counter() - turn_start) * 1000:.0f} ms, "
+                f"degradation {TIER_NAMES[tier]}"
+            )
 
     except Exception as e:
         logging.exception(f"An error occurred: {e}")
@@ -238,33 +90,31 @@ async def run_agent(input_dict: dict):
 
 async def context_agent(messages: List[dict]):
 
-    messages = copy.deepcopy(messages)
-
     # set up the base messages
-    system_prompt = {
-        "role": "system",
-        "content": CONTEXT_SYSTEM_PROMPT
-    }
-
-    messages.insert(0, system_prompt)
+    messages, prompt_tokens = compile_context_prompt(copy.deepcopy(messages))
+    logging.info(f"Context prompt tokens: {prompt_tokens}")
+    annotate_turn("context_prompt_tokens", prompt_tokens)
 
-    response = client.chat.completions.create(
-        model=os.environ["LLM_MODEL_ID"],
-        messages=messages,
-        max_tokens=500,
-    )
+    with stage("context_llm"):
+        response = await create_completion(
+            messages=messages,
+            max_tokens=500,
+        )
 
     # get the message
     response_message = response.choices[0].message.content
+    record_event("completions", {"stage": "context", "content": response_message})
     
     # log the raw response
-    logging.info(f"Context LLM Response: {response_message}")
+    log_payload("Context LLM Response", response_message)
     
     # try to extract calc_solve calls from the response
     try:
-        calc_solve_results = process_calc_solve(response_message)
+        # SymPy work runs off the event loop, in the shared calculation pool when there is one
+        with stage("calc_solve"):
+            calc_solve_results = await run_heavy(redis_client, "calc_solve", response_message)
         if calc_solve_results:
-            logging.info(f"calc_solve executed successfully: {calc_solve_results}")
+            log_payload("calc_solve executed successfully", calc_solve_results)
             return calc_solve_results
     except Exception as e:
         logging.error(f"Error processing calc_solve: {str(e)}")
@@ -272,45 +122,129 @@ async def context_agent(messages: List[dict]):
     return ""
 
 
-async def single_turn_agent(messages: List[dict], task_id: str):
+def is_complete_response(response_message: str) -> bool:
+    # only responses the widget pipeline can parse are worth caching
+    try:
+        response_message_dict = json.loads(response_message)
+    except (TypeError, ValueError):
+        return False
+    return isinstance(response_message_dict, dict) and "response" in response_message_dict
 
-    # get context
-    results = await context_agent(messages)
 
-    # set up the base messages
-    system_prompt = {
-        "role": "system",
-        "content": "\n# Instructions\n" + SYSTEM_PROMPT + f"\n### Most recent calculation:\n{results}\n",
-    }
-    first_assistant_message = {
-        "role": "assistant",
-        "content": "Hello! I am your math tutor that can help you learn. What would you like to work on today?",
+def response_cache_key(messages: List[dict]) -> str:
+    # a turn is repeated when the same question follows the same tutor message
+    tail = [(m.get("role"), m.get("content")) for m in messages[-2:]]
+    return cache_key("tutor_response", tail)
+
+
+def whiteboard_event(messages: List[dict], math_widgets_json: str) -> dict:
+    return {
+        "messages": [messages[-1]],
+        "node": "Widget",
+        "output": {
+            "type": "widget-information",
+            "details": math_widgets_json,
+        },
     }
-    messages.insert(0, system_prompt)
-    messages.insert(1, first_assistant_message)
 
-    # TODO: Improve this logic. This retries to ideally fix if there is a JSON error. Either except should be specific to JSON error or another model should fix the JSON.
+
+def restore_whiteboard(messages: List[dict], previous_widgets: str) -> dict:
+    session_data = session_var.get()
+    session_data["math-widgets"] = previous_widgets
+    session_var.set(session_data)
+    return whiteboard_event(messages, previous_widgets)
+
+
+async def single_turn_agent(messages: List[dict], task_id: str, tier: int = 0):
+
+    # for turns that need a calculation and a full whiteboard, acknowledge right away instead of
+    # leaving the student in silence until the LLM calls finish
+    topic = classify_turn(messages)
+    previous_widgets = None
+    if topic:
+        # these events carry the spoken acknowledgement as their assistant message, like every
+        # other event carries the reply, so history built from them does not repeat the student
+        acknowledgement_message = {"role": "assistant", "content": acknowledgement(messages)}
+        yield {
+            "messages": [acknowledgement_message],
+            "node": "CustomerResponse",
+            "output": acknowledgement_message["content"],
+        }
+        if tier < SPEECH_ONLY:
+            # the student's board, to put back if the turn ends without replacing the skeleton
+            previous_widgets = session_var.get().get("math-widgets") or "[]"
+            yield whiteboard_event([acknowledgement_message], json.dumps(skeleton_whiteboard(topic)))
+
     try:
-        response = client.chat.completions.create(
-            model=os.environ["LLM_MODEL_ID"],
-            messages=messages,
-            max_tokens=4096,
-            response_format={"type": "json_object"},
-        )
-    except:  # TODO: show output from last model to help this one fix JSON...
-        response = client.chat.completions.create(
-            model=os.environ["LLM_MODEL_ID"],
-            messages=messages,
-            max_tokens=4096,
-            response_format={"type": "json_object"},
-        )
+        async for out in answer_turn(messages, task_id, tier):
+            if out["node"] == "Widget":
+                previous_widgets = None
+            yield out
+    except Exception:
+        if previous_widgets is not None:
+            yield restore_whiteboard([acknowledgement_message], previous_widgets)
+        raise
+    if previous_widgets is not None:
+        # the turn was cancelled before its whiteboard was sent
+        yield restore_whiteboard([acknowledgement_message], previous_widgets)
 
-    # save the message
-    response_message = response.choices[0].message.content
+
+async def answer_turn(messages: List[dict], task_id: str, tier: int):
+
+    # under load, serve a repeated turn straight from the shared response cache
+    response_key = response_cache_key(messages)
+    cached_response = await asyncio.to_thread(get_cached, response_key) if tier >= CACHE_ONLY else None
+
+    # get context
+    results = await context_agent(messages) if tier < SKIP_CONTEXT and cached_response is None else ""
+
+    # under load, ask for a shorter answer rather than letting the token cap cut the JSON off
+    max_tokens = load_monitor.max_tokens(tier, 4096)
+    if tier >= SPEECH_ONLY:
+        instructions = [SPEECH_ONLY_INSTRUCTION]
+    elif tier >= CAP_TOKENS:
+        instructions = [CAP_TOKENS_INSTRUCTION.format(max_tokens=max_tokens)]
+    else:
+        instructions = None
+
+    # set up the base messages, keeping the calculation out of the cacheable prefix
+    prompt, prompt_tokens = compile_tutor_prompt(messages, calculation=results, instructions=instructions)
+    logging.info(f"Tutor prompt tokens: {prompt_tokens}")
+    annotate_turn("tutor_prompt_tokens", prompt_tokens)
+
+    if cached_response is not None:
+        response_message = cached_response
+        record_event("completions", {"stage": "tutor_cached", "content": response_message})
+    else:
+        # TODO: Improve this logic. This retries to ideally fix if there is a JSON error. Either except should be specific to JSON error or another model should fix the JSON.
+        with stage("tutor_llm"):
+            try:
+                response = await create_completion(
+                    messages=prompt,
+                    max_tokens=max_tokens,
+                    response_format={"type": "json_object"},
+                )
+            except Exception:  # TODO: show output from last model to help this one fix JSON...
+                response = await create_completion(
+                    messages=prompt,
+                    max_tokens=max_tokens,
+                    response_format={"type": "json_object"},
+                )
+
+        # save the message
+        response_message = response.choices[0].message.content
+        finish_reason = response.choices[0].finish_reason
+        record_event("completions", {"stage": "tutor", "content": response_message, "finish_reason": finish_reason})
+        # never cache a response cut off by the token cap or one that does not parse
+        truncated = finish_reason == "length"
+        if truncated:
+            logging.warning(f"Tutor response truncated at {max_tokens} tokens")
+        if tier < SPEECH_ONLY and not truncated and is_complete_response(response_message):
+            await asyncio.to_thread(set_cached, response_key, response_message)
     messages.append({"role": "assistant", "content": response_message})
 
     # log the response message
-    logging.info(f"LLM Response: {response_message}")
+    log_payload("LLM Response", response_message)
 
     # parse the response
     response_message_dict = json.loads(response_message)
@@ -320,14 +254,31 @@ async def single_turn_agent(messages: List[dict], task_id: str):
     session_data = session_var.get()
 
     # get stock widgets
-    if "widgets" in response_message_dict:
+    if tier >= SPEECH_ONLY:
+        # keep the current whiteboard rather than regenerating it
+        math_widgets = None
+    elif "widgets" in response_message_dict:
         math_widgets = response_message_dict["widgets"]
     else:
         math_widgets = []
-    logging.info(f"Rendering widgets: {math_widgets}")
-    math_widgets_json = json.dumps(math_widgets)
-    session_data["math-widgets"] = math_widgets_json
-    session_var.set(session_data)
+    if math_widgets is not None:
+        # repair broken LaTeX before it reaches the student, rather than costing a "show it again" turn
+        with stage("latex"):
+            math_widgets = normalize_widgets(math_widgets)
+        if any(widget.get("type") == "plotFunction" for widget in math_widgets):
+            with stage("widgets"):
+                try:
+                    math_widgets = await run_heavy(redis_client, "plot", math_widgets)
+                except (HeavyWorkTimeout, RuntimeError) as e:
+                    # the client shows a plot without data as unavailable
+                    logging.warning(f"Plots not rendered: {str(e)}")
+                    for widget in math_widgets:
+                        if widget.get("type") == "plotFunction":
+                            widget["data"] = None
+        math_widgets_json = json.dumps(math_widgets)
+        log_payload("Rendering widgets", math_widgets_json)
+        session_data["math-widgets"] = math_widgets_json
+        session_var.set(session_data)
 
     # check if the task has been canceled
     redis_status = await redis_client.get("task-" + task_id)
@@ -336,16 +287,8 @@ async def single_turn_agent(messages: List[dict], task_id: str):
         return
 
     # now yield the widget information
-    widget_output = {
-        "type": "widget-information",
-        "details": math_widgets_json,
-    }
-    out = {
-        "messages": [messages[-1]],
-        "node": "Widget",
-        "output": widget_output,
-    }
-    yield out
+    if math_widgets is not None:
+        yield whiteboard_event(messages, math_widgets_json)
 
     # use the "node" and "output" fields to ensure a response is sent to the front end through the xrx orchestrator
     out = {
@@ -0,0 +1,138 @@
+import asyncio
+import contextvars
+import json
+import logging
+import os
+import socket
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+import redis
+
+# Degradation tiers, each one including the ones before it
+NORMAL = 0
+SKIP_CONTEXT = 1     # skip the context agent LLM call (and so any calculation)
+CACHE_ONLY = 2       # serve repeated turns from the shared response cache without calling the LLM
+CAP_TOKENS = 3       # cap the tutor's output tokens
+SPEECH_ONLY = 4      # speech-only response, the whiteboard is not regenerated
+TIER_NAMES = ["normal", "skip_context", "cache_only", "cap_tokens", "speech_only"]
+
+DEGRADATION_ENABLED = os.getenv("DEGRADATION_ENABLED", "true").lower() == "true"
+# In-flight turns on this worker at which tiers 1..4 start
+QUEUE_DEPTH_THRESHOLDS = [int(v) for v in os.getenv("DEGRADE_QUEUE_DEPTHS", "8,16,24,32").split(",")]
+# Smoothed LLM call latency (ms) at which tiers 1..4 start
+LLM_LATENCY_THRESHOLDS = [float(v) for v in os.getenv("DEGRADE_LLM_LATENCY_MS", "3000,5000,8000,12000").split(",")]
+DEGRADED_MAX_TOKENS = int(os.getenv("DEGRADED_MAX_TOKENS", 1024))
+SPEECH_ONLY_MAX_TOKENS = int(os.getenv("SPEECH_ONLY_MAX_TOKENS", 300))
+# Weight of the newest sample in the LLM latency moving average
+LATENCY_SMOOTHING = 0.2
+
+# Tier metrics are published to Redis for the whole fleet:
+#   redis-cli hgetall metrics:turns-by-tier      turns served at each tier, all workers
+#   redis-cli get metrics:tier:<host>:<pid>      tier in force and load signals of a live worker
+TIER_METRICS_ENABLED = os.getenv("TIER_METRICS_ENABLED", "true").lower() == "true"
+TURNS_BY_TIER_KEY = "metrics:turns-by-tier"
+WORKER_TIER_KEY = "metrics:tier:{worker}"
+METRICS_PUBLISH_SECONDS = 5
+
+# lets replay reproduce the tier a turn was recorded under
+forced_tier_var = contextvars.ContextVar("forced_tier", default=None)
+
+
+def _level(value: float, thresholds: list) -> int:
+    return sum(value >= threshold for threshold in thresholds)
+
+
+class LoadMonitor:
+    """
+    Tracks the live load signals of this worker and maps them to a degradation tier.
+    """
+
+    def __init__(self):
+        self.enabled = DEGRADATION_ENABLED
+        self.in_flight = 0
+        self.llm_latency_ms = 0.0
+        self.turns_by_tier = Counter()
+        self._last_tier = NORMAL
+        self._unpublished = Counter()
+        self._last_publish = 0.0
+        self._publishing = None
+
+    @contextmanager
+    def turn(self):
+        self.in_flight += 1
+        try:
+            yield
+        finally:
+            self.in_flight -= 1
+
+    def observe_llm_latency(self, elapsed_ms: float):
+        if self.llm_latency_ms == 0.0:
+            self.llm_latency_ms = elapsed_ms
+        else:
+            self.llm_latency_ms += LATENCY_SMOOTHING * (elapsed_ms - self.llm_latency_ms)
+
+    def tier(self) -> int:
+        forced = forced_tier_var.get()
+        if forced is not None:
+            return forced
+        if not self.enabled:
+            return NORMAL
+        tier = max(_level(self.in_flight, QUEUE_DEPTH_THRESHOLDS), _level(self.llm_latency_ms, LLM_LATENCY_THRESHOLDS))
+        if tier != self._last_tier:
+            logging.warning(
+                f"Degradation tier {TIER_NAMES[self._last_tier]} -> {TIER_NAMES[tier]} "
+                f"(in flight: {self.in_flight}, LLM latency: {self.llm_latency_ms:.0f} ms)"
+            )
+            self._last_tier = tier
+        self.turns_by_tier[TIER_NAMES[tier]] += 1
+        self._unpublished[TIER_NAMES[tier]] += 1
+        return tier
+
+    def max_tokens(self, tier: int, default: int) -> int:
+        if tier >= SPEECH_ONLY:
+            return min(default, SPEECH_ONLY_MAX_TOKENS)
+        if tier >= CAP_TOKENS:
+            return min(default, DEGRADED_MAX_TOKENS)
+        return default
+
+    def metrics(self) -> dict:
+        return {
+            "tier": TIER_NAMES[self._last_tier],
+            "in_flight": self.in_flight,
+            "llm_latency_ms": round(self.llm_latency_ms),
+            "turns_by_tier": dict(self.turns_by_tier),
+        }
+
+    def publish_soon(self, client):
+        """
+        Publishes the tier metrics in the background, at most every METRICS_PUBLISH_SECONDS.
+        """
+        if not TIER_METRICS_ENABLED or time.monotonic() - self._last_publish < METRICS_PUBLISH_SECONDS:
+            return
+        if self._publishing is not None and not self._publishing.done():
+            return
+        self._last_publish = time.monotonic()
+        self._publishing = asyncio.create_task(self.publish(client))
+
+    async def publish(self, client):
+        """
+        Adds the turns counted since the last publish to the fleet-wide counters and refreshes
+        this worker's metrics, which expire if the worker goes away.
+        """
+        pending, self._unpublished = self._unpublished, Counter()
+        worker = f"{socket.gethostname()}:{os.getpid()}"
+        try:
+            pipe = client.pipeline(transaction=False)
+            for name, count in pending.items():
+                pipe.hincrby(TURNS_BY_TIER_KEY, name, count)
+            pipe.set(WORKER_TIER_KEY.format(worker=worker), json.dumps(self.metrics()), ex=3 * METRICS_PUBLISH_SECONDS)
+            await pipe.execute()
+        except redis.RedisError as e:
+            # keep the counts for the next attempt
+            self._unpublished.update(pending)
+            logging.warning(f"Could not publish tier metrics: {str(e)}")
+
+
+load_monitor = LoadMonitor()
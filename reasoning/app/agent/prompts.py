@@ -0,0 +1,368 @@
+from functools import lru_cache
+from typing import List, Optional
+import re
+
+# Prompts are assembled so that everything before the conversation is byte-stable for a given
+# topic (and so cacheable by the provider), while per-turn context such as calculation results
+# goes in a trailing message after the conversation.
+
+TOPICS = [
+    (re.compile(r"integra|antiderivative", re.IGNORECASE), "Integral"),
+    (re.compile(r"derivative|differentiat", re.IGNORECASE), "Derivative"),
+    (re.compile(r"limit", re.IGNORECASE), "Limit"),
+    (re.compile(r"series|taylor", re.IGNORECASE), "Series Expansion"),
+    (re.compile(r"graph|plot|sketch|tangent line|area under", re.IGNORECASE), "Graph"),
+]
+MAX_EXAMPLES = 2
+
+FIRST_ASSISTANT_MESSAGE = "Hello! I am your math tutor that can help you learn. What would you like to work on today?"
+
+TUTOR_INSTRUCTIONS = """You are a calculus tutor that helps students. You can show live interfaces to the user of mathematic equations as a whiteboard with LaTeX styling.
+
+## Style and Tone
+* You should remain friendly and concise.
+* Roll with the punches while staying on task of getting your required information.
+* Your response will be said out loud as audio to the student, so make sure your response will sound natural when it is spoken.
+* You should sound like a normal person. Do not sound robotic at all.
+
+## Interface
+
+1. defineWhiteboard
+   - Description: This tool defines what is currently shown on the whiteboard to the student.
+   - Parameters:
+     - content: String (latex styled content for the whiteboard)
+    - Example:
+        - defineWhiteboard": { "parameters": { "content": "### Definition of a derivative:\n\n$$\\frac{df}{dx} = \\lim_{h \to 0} \\frac{f(x + h) - f(x)}{h}$$" } }
+
+2. plotFunction
+   - Description: This tool shows a graph of a function of x to the student. Use it alongside the whiteboard when a picture helps, for example to show a function with its derivative, a tangent line, or the area under a curve.
+   - Parameters:
+     - expression: String (function of x in Python syntax, e.g. "x^3 - 3*x". Reuse the expression from the most recent calculation when there is one.)
+     - xMin: Number (left edge of the graph, default -10)
+     - xMax: Number (right edge of the graph, default 10)
+     - showDerivative: Boolean (also draw f'(x), default false)
+     - tangentAt: Number (optional, draw the tangent line at this x)
+     - areaFrom, areaTo: Numbers (optional, shade the area under the curve between these x values)
+    - Example:
+        - plotFunction": { "parameters": { "expression": "x^2", "xMin": -3, "xMax": 3, "tangentAt": 1 } }
+
+## Output format
+
+Your response must be perfectly formatted JSON with the following structure
+
+{
+    "widgets": [
+        {
+        "type":"defineWhiteboard",
+        "parameters": { "content": "### Definition of a derivative:\n\n$$\\frac{df}{dx} = \\lim_{h \to 0} \\frac{f(x + h) - f(x)}{h}$$" }
+        }
+    ],
+    "response": "your response to the student"
+}"""
+
+TUTOR_RULES = """## Rules
+* Ask feedback questions if you do not understand what the person was saying
+* Always speak in a human-like manner. Your goal is to sound as little like a robotic voice as possible.
+* Do not ask people for specific formats of information. Ask them like a normal person would.
+* Use markdown formatting as much as possible and reasonable.
+* Use $$ around any latex formatted equations.
+* Use dividers (---) between sections.
+* Make sure to include a response AND whiteboard content with every request.
+* ALWAYS use two backslashs when needed before all latex equations. (i.e. lim should be \\lim, frac should be \\frac)"""
+
+# Few-shot examples for the tutor, tagged with the topics they are relevant to
+TUTOR_EXAMPLES = [
+    {
+        "name": "greeting",
+        "topics": (),
+        "content": """Assistant (you): {
+"widgets": [],
+"response": "Hi! I'm your calculus tutor. I can help explain concepts and work through problems with you using an interactive whiteboard. What would you like to work on today?"
+}""",
+    },
+    {
+        "name": "derivative_rules",
+        "topics": ("Derivative",),
+        "content": """User: Can you explain derivatives?
+
+Assistant (you): {
+"widgets": [
+{
+"type": "defineWhiteboard",
+"parameters": {
+"content": "### Introduction to Derivatives\n\nThe derivative measures instantaneous rate of change. It can be defined as:\n\n$$f'(x) = \\lim_{h \to 0} \\frac{f(x + h) - f(x)}{h}$$\n\nGeometrically, this represents:\n- The slope of the tangent line at any point\n- The instantaneous rate of change\n- The velocity at any moment (when $f(x)$ represents position)\n\nExample: When $f(x) = x^2$, the derivative is:\n$$\\frac{d}{dx}(x^2) = \\lim_{h \to 0} \\frac{(x+h)^2 - x^2}{h} = 2x$$"
+}
+}
+],
+"response": "The derivative measures how quickly a function changes. I've written the formal definition and included both its mathematical and geometric interpretations. Would you like to learn some rules for calculating derivatives?"
+}
+
+User: Yes, show me the power rule
+
+Assistant (you): {
+"widgets": [
+{
+"type": "defineWhiteboard",
+"parameters": {
+"content": "### Derivative Rules\n\n1) Power Rule: For any real number $n$\n$$\\frac{d}{dx}(x^n) = nx^{n-1}$$\n\n2) Constant Multiple Rule:\n$$\\frac{d}{dx}(cf(x)) = c\\frac{d}{dx}f(x)$$\n\nExamples:\n\n$f(x) = x^3 \\implies f'(x) = 3x^2$\n\n$g(x) = 5x^4 \\implies g'(x) = 20x^3$\n\n$h(x) = \pi x^2 \\implies h'(x) = 2\pi x$\n\nTry this: Find $\\frac{d}{dx}(4x^5)$"
+}
+}
+],
+"response": "Here's the power rule along with the constant multiple rule. Notice how we can combine them to find derivatives of terms like 5x^4. Want to try the practice problem I wrote at the bottom?"
+}""",
+    },
+    {
+        "name": "check_answer",
+        "topics": ("Derivative",),
+        "content": """User: Let me try. Would it be 20x^4?
+
+Assistant (you): {
+"widgets": 
+[
+{
+"type": "defineWhiteboard",
+"parameters": {
+"content": "### Solution\n\nFor $f(x) = 4x^5$:\n\n$$\begin{align*}\n\\frac{d}{dx}(4x^5) &= 4 \cdot \\frac{d}{dx}(x^5) \quad \text{(Constant Multiple Rule)} \\\n&= 4 \cdot 5x^4 \quad \text{(Power Rule)} \\\n&= 20x^4 \quad ✓\n\end{align*}$$\n\nLet's try a more complex example:\n\nFind $\\frac{d}{dx}(2x^3 + \pi x^2 - \sqrt{x})$\n\nHint: $\sqrt{x} = x^{\\frac{1}{2}}$"
+}
+}
+],
+"response": "Exactly right! I've shown the step-by-step solution using both the constant multiple rule and the power rule. Ready to try a more challenging problem that combines multiple terms?"
+}""",
+    },
+    {
+        "name": "integral",
+        "topics": ("Integral",),
+        "content": """User: How do I integrate 2x cos(x^2)?
+
+Assistant (you): {
+"widgets": [
+{
+"type": "defineWhiteboard",
+"parameters": {
+"content": "### Integration by Substitution\n\nFind $\\int 2x\\cos(x^2)\\,dx$\n\n---\n\nLet $u = x^2$, so $du = 2x\\,dx$:\n\n$$\\int 2x\\cos(x^2)\\,dx = \\int \\cos(u)\\,du = \\sin(u) + C = \\sin(x^2) + C$$\n\n---\n\nCheck: $\\frac{d}{dx}\\sin(x^2) = 2x\\cos(x^2)$ ✓"
+}
+}
+],
+"response": "This one is a great fit for substitution. If we let u be x squared, then du is exactly 2x dx, so the whole thing becomes the integral of cosine of u. That gives sine of x squared plus C. Want to try one on your own?"
+}""",
+    },
+    {
+        "name": "limit",
+        "topics": ("Limit",),
+        "content": """User: What's the limit of (x^2-1)/(x-1) as x goes to 1?
+
+Assistant (you): {
+"widgets": [
+{
+"type": "defineWhiteboard",
+"parameters": {
+"content": "### Evaluating a Limit\n\nDirect substitution gives $\\frac{0}{0}$, so we factor first:\n\n$$\\lim_{x \\to 1} \\frac{x^2 - 1}{x - 1} = \\lim_{x \\to 1} \\frac{(x-1)(x+1)}{x - 1} = \\lim_{x \\to 1} (x + 1) = 2$$"
+}
+}
+],
+"response": "If you plug in 1 right away you get zero over zero, which doesn't tell us much. But the top factors into x minus 1 times x plus 1, so the x minus 1 cancels and we're left with x plus 1. As x goes to 1, that's 2."
+}""",
+    },
+    {
+        "name": "graph",
+        "topics": ("Graph", "Derivative"),
+        "content": """User: Can you show me the tangent line to x^2 at x = 1?
+
+Assistant (you): {
+"widgets": [
+{
+"type": "defineWhiteboard",
+"parameters": {
+"content": "### Tangent Line\n\nFor $f(x) = x^2$, $f'(x) = 2x$, so the slope at $x = 1$ is $2$:\n\n$$y = f(1) + f'(1)(x - 1) = 2x - 1$$"
+}
+},
+{
+"type": "plotFunction",
+"parameters": { "expression": "x^2", "xMin": -3, "xMax": 3, "tangentAt": 1 }
+}
+],
+"response": "Here's the parabola with its tangent line at x equals 1. The derivative there is 2, so the line has slope 2 and touches the curve at the point 1, 1. Notice how it just grazes the curve."
+}""",
+    },
+]
+
+CONTEXT_INSTRUCTIONS = """# Calculator Tool Instructions
+
+You have a symbolic mathematics calculator that can solve various calculus problems. Here's how to use it:
+
+## Basic Function Signature
+```python
+calc_solve(expression, operation='derivative', point=None, terms=None)
+```
+
+## Several Operations on One Expression
+When the student needs more than one result for the same expression, use a single batch call instead of repeated calc_solve calls:
+```python
+calc_batch("exp(x)", operations=["derivative", "series"], point=0, terms=4)
+```
+
+## Valid Operations
+- `derivative`: Find the derivative of an expression
+- `integral`: Find the indefinite integral
+- `limit`: Calculate a limit at a point
+- `series`: Generate a series expansion
+
+## Input Format
+- Use standard mathematical notation with Python syntax
+- Variable should be 'x'
+- Use * for multiplication: `2*x` not `2x`
+- Use ** or ^ for powers: `x**2` or `x^2`
+- Functions available: sin, cos, tan, exp, log, sqrt"""
+
+CONTEXT_REFERENCE = """## Common Functions
+- Trigonometric: sin(x), cos(x), tan(x)
+- Exponential: exp(x)
+- Logarithmic: log(x)
+- Square root: sqrt(x)
+
+## Error Cases to Handle
+- Invalid expressions will return error message
+- Missing required parameters for limit/series will return error
+- Invalid operations will return error message
+
+Each result includes:
+1. The original expression
+2. Step-by-step solution process
+3. Final result
+4. Verification when applicable
+
+## Common Patterns and Tips
+1. Always check if required parameters are provided for the operation
+2. Use proper Python syntax for mathematical expressions"""
+
+CONTEXT_OUTPUT = """# Output Instructions
+
+You are gathering context before you provide a response to the student. You are to determine if your response will require a calculation, and if so, perform it. Otherwise, do nothing.
+
+Your response would require a calculation (or multiple) if the student asked for the solution (final or step by step) to a specific problem, or if they asked for a worked out example.
+
+ONLY output "calc_solve(...)" or "calc_batch(...)", otherwise, no output is required. Do not try to solve without the function. ONLY use calc_solve if you have been ASKED to solve an equation. 
+
+Use calc_solve always when: 
+- You are asked to generate a solution.
+
+Do not use calc_solve when:
+- You are asked to generate a problem."""
+
+# calc_solve examples for the context agent, by topic
+CONTEXT_EXAMPLES = {
+    "Derivative": """Basic Derivatives
+```python
+calc_solve("x^2 + sin(x)")
+calc_solve("exp(x) + 5*x^3")
+calc_solve("x^3 + 2*x^2 - 5*x + 3")
+```""",
+    "Integral": """Integrals
+```python
+calc_solve("3*x^2 + 2*x", operation="integral")
+calc_solve("sin(x)*cos(x)", operation="integral")
+calc_solve("sin(2*x)", operation="integral")
+```""",
+    "Limit": """Limits
+```python
+calc_solve("sin(x)/x", operation="limit", point=0)
+calc_solve("(x^2-1)/(x-1)", operation="limit", point=1)
+calc_solve("(x^2-4)/(x-2)", operation="limit", point=2)
+```""",
+    "Series Expansion": """Series Expansions
+```python
+calc_solve("exp(x)", operation="series", point=0, terms=4)
+calc_solve("sin(x)", operation="series", point=0, terms=5)
+```""",
+}
+
+
+def detect_topic(text: str) -> Optional[str]:
+    for pattern, topic in TOPICS:
+        if pattern.search(text or ""):
+            return topic
+    return None
+
+
+def estimate_tokens(text: str) -> int:
+    # roughly four characters per token for English and LaTeX; good enough to compare sections
+    return (len(text) + 3) // 4
+
+
+@lru_cache(maxsize=None)
+def tutor_prefix(topic: Optional[str]) -> tuple:
+    """
+    Returns the tutor system message for a topic and the token estimate of each of its sections.
+    """
+    examples = [example for example in TUTOR_EXAMPLES if topic in example["topics"]][:MAX_EXAMPLES]
+    if not examples:
+        examples = [example for example in TUTOR_EXAMPLES if example["name"] in ("greeting", "derivative_rules")]
+    examples_text = "\n\n".join(f"## Example {i}\n\n{example['content']}" for i, example in enumerate(examples, 1))
+    content = f"\n# Instructions\n{TUTOR_INSTRUCTIONS}\n\n{TUTOR_RULES}\n\n{examples_text}\n"
+    tokens = {
+        "instructions": estimate_tokens(TUTOR_INSTRUCTIONS),
+        "rules": estimate_tokens(TUTOR_RULES),
+        "examples": estimate_tokens(examples_text),
+    }
+    return content, tokens
+
+
+@lru_cache(maxsize=None)
+def context_prefix(topic: Optional[str]) -> tuple:
+    """
+    Returns the context agent system message for a topic and the token estimate of each of its sections.
+    """
+    if topic in CONTEXT_EXAMPLES:
+        examples = [CONTEXT_EXAMPLES[topic]]
+    else:
+        examples = list(CONTEXT_EXAMPLES.values())
+    examples_text = "## Examples\n\n" + "\n\n".join(f"{i}. {example}" for i, example in enumerate(examples, 1))
+    content = f"\n{CONTEXT_INSTRUCTIONS}\n\n{CONTEXT_REFERENCE}\n\n{CONTEXT_OUTPUT}\n\n{examples_text}\n"
+    tokens = {
+        "instructions": estimate_tokens(CONTEXT_INSTRUCTIONS) + estimate_tokens(CONTEXT_OUTPUT),
+        "reference": estimate_tokens(CONTEXT_REFERENCE),
+        "examples": estimate_tokens(examples_text),
+    }
+    return content, tokens
+
+
+def _conversation_tokens(messages: List[dict]) -> int:
+    return sum(estimate_tokens(message.get("content") or "") for message in messages)
+
+
+def compile_context_prompt(messages: List[dict]) -> tuple:
+    """
+    Builds the context agent messages. Returns the messages and token estimates per section.
+    """
+    topic = detect_topic(messages[-1].get("content") if messages else "")
+    content, tokens = context_prefix(topic)
+    prompt = [{"role": "system", "content": content}] + messages
+    tokens = dict(tokens, conversation=_conversation_tokens(messages))
+    tokens["total"] = sum(tokens.values())
+    return prompt, tokens
+
+
+def compile_tutor_prompt(messages: List[dict], calculation: str = "", instructions: Optional[List[str]] = None) -> tuple:
+    """
+    Builds the tutor messages: a stable system prefix with the examples relevant to the topic, the
+    conversation, then the volatile calculation results and any per-turn instructions.
+    Returns the messages and token estimates per section.
+    """
+    topic = detect_topic(messages[-1].get("content") if messages else "")
+    content, tokens = tutor_prefix(topic)
+    prompt = [
+        {"role": "system", "content": content},
+        {"role": "assistant", "content": FIRST_ASSISTANT_MESSAGE},
+    ] + messages
+    tokens = dict(tokens, conversation=_conversation_tokens(prompt[1:]))
+
+    trailing = []
+    if calculation:
+        trailing.append(f"### Most recent calculation:\n{calculation}")
+    trailing.extend(instructions or [])
+    if trailing:
+        prompt.append({"role": "system", "content": "\n\n".join(trailing)})
+    tokens["calculation"] = estimate_tokens(calculation)
+    tokens["instructions"] = tokens["instructions"] + sum(estimate_tokens(text) for text in instructions or [])
+    tokens["total"] = sum(tokens.values())
+    return prompt, tokens
@@ -0,0 +1,185 @@
+import atexit
+import contextvars
+import copy
+import hashlib
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from contextlib import contextmanager
+from typing import List
+
+# When set, every turn is appended as one JSON line to a per-worker file in this directory
+RECORD_DIR = os.getenv("REASONING_RECORD_DIR")
+RECORD_FORMAT_VERSION = 2
+# Messages and session values at least this long (as JSON) are written once per file and
+# referenced by hash, since every turn repeats the history and the whiteboard state
+BLOB_MIN_SIZE = 256
+
+_writer_queue = None
+_writer_pid = None
+_writer_lock = threading.Lock()
+
+turn_record_var = contextvars.ContextVar("turn_record", default=None)
+
+
+def new_turn_record(messages: List[dict], session: dict, task_id: str) -> dict:
+    return {
+        "version": RECORD_FORMAT_VERSION,
+        "recorded_at": time.time(),
+        "task_id": task_id,
+        "session": copy.deepcopy(session),
+        "messages": copy.deepcopy(messages),
+        "completions": [],
+        "calc_solve": [],
+        "timings": {},
+    }
+
+
+@contextmanager
+def record_turn(messages: List[dict], session: dict, task_id: str):
+    """
+    Records the turn if recording is enabled. If a record is already active (e.g. during
+    replay) it is reused and the caller is responsible for it.
+    """
+    record = turn_record_var.get()
+    if record is not None or not RECORD_DIR:
+        yield record
+        return
+
+    record = new_turn_record(messages, session, task_id)
+    token = turn_record_var.set(record)
+    try:
+        yield record
+    finally:
+        turn_record_var.reset(token)
+        write_turn(record)
+
+
+def record_event(kind: str, payload: dict):
+    """
+    Appends a payload to a list in the active turn record, if any.
+    """
+    record = turn_record_var.get()
+    if record is not None:
+        record[kind].append(payload)
+
+
+@contextmanager
+def stage(name: str):
+    """
+    Times a pipeline stage into the active turn record, in milliseconds.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record = turn_record_var.get()
+        if record is not None:
+            elapsed = (time.perf_counter() - start) * 1000
+            record["timings"][name] = record["timings"].get(name, 0.0) + elapsed
+
+
+def annotate_turn(key: str, value):
+    """
+    Sets a top-level field (e.g. the degradation tier) on the active turn record.
+    """
+    record = turn_record_var.get()
+    if record is not None:
+        record[key] = value
+
+
+def record_timing(name: str, elapsed: float):
+    """
+    Records a point-in-turn latency (e.g. time to the first response) in milliseconds.
+    """
+    record = turn_record_var.get()
+    if record is not None:
+        record["timings"][name] = elapsed
+
+
+def _dumps(value) -> str:
+    return json.dumps(value, separators=(",", ":"), default=str)
+
+
+def _blob_ref(value, blobs: dict, written: set):
+    """
+    Returns a hash reference for a large value, adding it to blobs unless already written.
+    """
+    encoded = _dumps(value)
+    if len(encoded) < BLOB_MIN_SIZE:
+        return value
+    digest = hashlib.sha256(encoded.encode()).hexdigest()
+    if digest not in written:
+        blobs[digest] = encoded
+    return {"$blob": digest}
+
+
+def _write_turns(records: queue.SimpleQueue):
+    path = os.path.join(RECORD_DIR, f"turns-{os.getpid()}.jsonl")
+    written = set()
+    while True:
+        record = records.get()
+        if record is None:
+            return
+        try:
+            blobs = {}
+            record = dict(record)
+            record["messages"] = [_blob_ref(message, blobs, written) for message in record["messages"]]
+            record["session"] = {key: _blob_ref(value, blobs, written) for key, value in record["session"].items()}
+            lines = [f'{{"blob":"{digest}","value":{encoded}}}\n' for digest, encoded in blobs.items()]
+            lines.append(_dumps(record) + "\n")
+            os.makedirs(RECORD_DIR, exist_ok=True)
+            with open(path, "a", encoding="utf-8") as f:
+                f.write("".join(lines))
+            written.update(blobs)
+        except Exception:
+            logging.exception("Could not write a turn record")
+
+
+def _stop_writer(records: queue.SimpleQueue, writer: threading.Thread):
+    records.put(None)
+    writer.join()
+
+
+def write_turn(record: dict):
+    """
+    Queues a finished turn for the writer thread, so serialization and file I/O stay off the
+    event loop.
+    """
+    global _writer_queue, _writer_pid
+    if _writer_pid != os.getpid():
+        with _writer_lock:
+            if _writer_pid != os.getpid():
+                # threads do not survive fork, so every worker starts its own writer
+                _writer_queue = queue.SimpleQueue()
+                writer = threading.Thread(target=_write_turns, args=(_writer_queue,), name="turn-writer", daemon=True)
+                writer.start()
+                # write whatever is still queued when the process exits
+                atexit.register(_stop_writer, _writer_queue, writer)
+                _writer_pid = os.getpid()
+    _writer_queue.put(record)
+
+
+def _resolve(value, blobs: dict):
+    if isinstance(value, dict) and len(value) == 1 and "$blob" in value:
+        return blobs[value["$blob"]]
+    return value
+
+
+def read_turns(paths: List[str]):
+    for path in paths:
+        blobs = {}
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                entry = json.loads(line)
+                if "blob" in entry:
+                    blobs[entry["blob"]] = entry["value"]
+                    continue
+                entry["messages"] = [_resolve(message, blobs) for message in entry["messages"]]
+                entry["session"] = {key: _resolve(value, blobs) for key, value in entry["session"].items()}
+                yield entry
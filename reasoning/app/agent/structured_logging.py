@@ -0,0 +1,171 @@
+import atexit
+import hashlib
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from logging.handlers import QueueHandler, QueueListener
+
+import redis
+
+from .context_manager import session_var
+
+# Logging on the hot path only builds a LogRecord and puts it on a queue. Formatting, payload
+# truncation/hashing and the actual I/O happen on a background thread.
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+# Payloads (LLM responses, widgets, agent output) longer than this are truncated and referenced by hash
+LOG_PAYLOAD_CAP = int(os.getenv("LOG_PAYLOAD_CAP", 2000))
+# Fraction of sessions whose payloads are always logged in full
+LOG_FULL_PAYLOAD_SAMPLE_RATE = float(os.getenv("LOG_FULL_PAYLOAD_SAMPLE_RATE", 0.01))
+
+# Level and sample rate can be changed at runtime for all workers through these Redis keys, e.g.
+#   redis-cli set logging:level DEBUG
+#   redis-cli set logging:sample-rate 0.5
+LEVEL_KEY = "logging:level"
+SAMPLE_RATE_KEY = "logging:sample-rate"
+CONFIG_REFRESH_SECONDS = 15
+
+logger = logging.getLogger()
+_sample_rate = LOG_FULL_PAYLOAD_SAMPLE_RATE
+_listener_pid = None
+_listener_lock = threading.Lock()
+
+
+class StructuredFormatter(logging.Formatter):
+    """
+    Formats records as one JSON object per line, capping payloads that are not sampled.
+    """
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+        }
+        session_id = getattr(record, "session_id", None)
+        if session_id is not None:
+            entry["session"] = session_id
+
+        payload = getattr(record, "payload", None)
+        if payload is None:
+            entry["msg"] = record.getMessage()
+        else:
+            entry["msg"] = record.msg
+            entry["payload_size"] = len(payload)
+            if record.full_payload or len(payload) <= LOG_PAYLOAD_CAP:
+                entry["payload"] = payload
+            else:
+                entry["payload"] = payload[:LOG_PAYLOAD_CAP]
+                entry["payload_sha256"] = hashlib.sha256(payload.encode()).hexdigest()
+                entry["truncated"] = True
+
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class SessionFilter(logging.Filter):
+    """
+    Tags records with the current session id while still on the calling thread.
+    """
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        session = session_var.get()
+        if isinstance(session, dict) and "session_id" not in record.__dict__:
+            record.session_id = session.get("id")
+        return True
+
+
+class BackgroundHandler(QueueHandler):
+    """
+    Hands records to a listener thread, started lazily so each forked worker gets its own.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # the queue never leaves the process, so formatting is left to the listener thread
+        return record
+
+    def emit(self, record: logging.LogRecord):
+        _ensure_listener(self)
+        super().emit(record)
+
+
+def _refresh_config():
+    global _sample_rate
+    client = redis.Redis(host=os.getenv("REDIS_HOST", "localhost"), port=6379, db=0, socket_timeout=1)
+    invalid = set()
+    while True:
+        time.sleep(CONFIG_REFRESH_SECONDS)
+        try:
+            level, rate = client.mget(LEVEL_KEY, SAMPLE_RATE_KEY)
+        except redis.RedisError:
+            continue
+        # a bad value is reported once and ignored, so later changes still apply
+        if level:
+            try:
+                logger.setLevel(level.decode().upper())
+            except (ValueError, TypeError, UnicodeDecodeError) as e:
+                if (LEVEL_KEY, level) not in invalid:
+                    invalid.add((LEVEL_KEY, level))
+                    logger.error(f"Ignoring invalid {LEVEL_KEY} {level!r}: {str(e)}")
+        if rate:
+            try:
+                _sample_rate = float(rate)
+            except ValueError as e:
+                if (SAMPLE_RATE_KEY, rate) not in invalid:
+                    invalid.add((SAMPLE_RATE_KEY, rate))
+                    logger.error(f"Ignoring invalid {SAMPLE_RATE_KEY} {rate!r}: {str(e)}")
+
+
+def _ensure_listener(handler: BackgroundHandler):
+    global _listener_pid
+    if _listener_pid == os.getpid():
+        return
+    with _listener_lock:
+        if _listener_pid == os.getpid():
+            return
+        # threads do not survive fork, so every process starts its own listener and config poller
+        handler.queue = queue.SimpleQueue()
+        output = logging.StreamHandler()
+        output.setFormatter(StructuredFormatter())
+        listener = QueueListener(handler.queue, output, respect_handler_level=False)
+        listener.start()
+        # flush whatever is still queued when the process exits
+        atexit.register(listener.stop)
+        threading.Thread(target=_refresh_config, name="log-config", daemon=True).start()
+        _listener_pid = os.getpid()
+
+
+def configure_logging():
+    """
+    Routes the root logger through the background handler. Safe to call more than once.
+    """
+    if any(isinstance(h, BackgroundHandler) for h in logger.handlers):
+        return
+    handler = BackgroundHandler(queue.SimpleQueue())
+    handler.addFilter(SessionFilter())
+    logger.handlers = [handler]
+    logger.setLevel(LOG_LEVEL)
+
+
+def _session_sampled(session_id) -> bool:
+    if session_id is None or _sample_rate <= 0:
+        return False
+    digest = hashlib.sha1(str(session_id).encode()).digest()
+    return int.from_bytes(digest[:4], "big") / 2 ** 32 < _sample_rate
+
+
+def log_payload(label: str, payload: str, level: int = logging.INFO):
+    """
+    Logs a potentially large payload. It is capped and hashed on the listener thread unless
+    the session is sampled for full payload logging or DEBUG is enabled.
+    """
+    if not logger.isEnabledFor(level):
+        return
+    session = session_var.get()
+    session_id = session.get("id") if isinstance(session, dict) else None
+    full = logger.isEnabledFor(logging.DEBUG) or _session_sampled(session_id)
+    logger.log(level, label, extra={"payload": payload, "full_payload": full, "session_id": session_id})
@@ -0,0 +1,89 @@
+from collections import OrderedDict
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+
+import redis
+
+# Results cached here are shared by every reasoning worker through Redis, with a small
+# per-process LRU in front of it so hot entries and Redis outages cost nothing.
+redis_host = os.getenv("REDIS_HOST", "localhost")
+CACHE_ENABLED = os.getenv("SHARED_CACHE_ENABLED", "true").lower() == "true"
+CACHE_TTL_SECONDS = int(os.getenv("SHARED_CACHE_TTL_SECONDS", 24 * 3600))
+LOCAL_CACHE_SIZE = int(os.getenv("LOCAL_CACHE_SIZE", 1024))
+# After a Redis error, stop trying for this many seconds instead of paying a timeout per lookup
+REDIS_RETRY_SECONDS = 30
+
+# redis-py resets its connection pool after fork, so this client is safe to create before workers are forked
+_redis = redis.Redis(host=redis_host, port=6379, db=0, socket_timeout=0.05, socket_connect_timeout=0.05)
+_redis_down_until = 0.0
+_local = OrderedDict()
+# lookups run in worker threads (asyncio.to_thread), so the LRU bookkeeping is locked
+_local_lock = threading.Lock()
+
+
+def cache_key(namespace: str, *parts) -> str:
+    """
+    Builds a stable key from a namespace and any JSON-serializable parts.
+    """
+    digest = hashlib.sha256(json.dumps(parts, sort_keys=True, default=str).encode()).hexdigest()
+    return f"cache:{namespace}:{digest}"
+
+
+def _local_get(key: str):
+    with _local_lock:
+        if key in _local:
+            _local.move_to_end(key)
+            return _local[key]
+    return None
+
+
+def _local_set(key: str, value: str):
+    with _local_lock:
+        _local[key] = value
+        _local.move_to_end(key)
+        while len(_local) > LOCAL_CACHE_SIZE:
+            _local.popitem(last=False)
+
+
+def _redis_call(method: str, *args):
+    global _redis_down_until
+    if time.monotonic() < _redis_down_until:
+        return None
+    try:
+        return getattr(_redis, method)(*args)
+    except redis.RedisError as e:
+        logging.warning(f"Shared cache unavailable, using local cache only: {str(e)}")
+        _redis_down_until = time.monotonic() + REDIS_RETRY_SECONDS
+        return None
+
+
+def get_cached(key: str):
+    """
+    Returns the cached string for a key, checking the local LRU before Redis. This blocks for up
+    to the Redis socket timeout, so call it from a worker thread, not the event loop.
+    """
+    if not CACHE_ENABLED:
+        return None
+    value = _local_get(key)
+    if value is not None:
+        return value
+    value = _redis_call("get", key)
+    if value is None:
+        return None
+    value = value.decode() if isinstance(value, bytes) else value
+    _local_set(key, value)
+    return value
+
+
+def set_cached(key: str, value: str):
+    """
+    Stores a string in the local LRU and in Redis for the other workers.
+    """
+    if not CACHE_ENABLED:
+        return
+    _local_set(key, value)
+    _redis_call("set", key, value, CACHE_TTL_SECONDS)
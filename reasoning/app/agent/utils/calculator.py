@@ -2,134 +2,380 @@ from sympy import *
 from sympy.abc import x
 import re
 import logging
-from typing import Optional
+from typing import List, Optional
 import ast
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+
+from .cache import cache_key, get_cached, set_cached
+from ..recorder import record_event
+
+# Threads overlap independent operations of a batch; SymPy holds the GIL, so this bounds latency
+# for mixed batches rather than adding CPU parallelism.
+BATCH_THREADS = int(os.getenv("CALC_BATCH_THREADS", 4))
+
+_pool = None
+_pool_pid = None
+
+
+class SharedExpression:
+    """
+    One parsed expression whose intermediate results (derivatives of every order) are computed
+    once and shared by all the operations of a batch. shared_orders is the highest derivative
+    order the batch computes anyway, which other operations may reuse for free.
+    """
+
+    def __init__(self, expr, shared_orders: int = 0):
+        self.expr = expr
+        self.shared_orders = shared_orders
+        self._derivatives = [expr]
+        self._lock = threading.Lock()
+
+    def derivative(self, order: int = 1):
+        with self._lock:
+            while len(self._derivatives) <= order:
+                self._derivatives.append(diff(self._derivatives[-1], x))
+            return self._derivatives[order]
+
+
+@lru_cache(maxsize=256)
+def parse_expression(expression: str):
+    # Convert ^ to ** for Python syntax
+    return sympify(expression.replace('^', '**'))
+
+
+def _derivative_steps(shared: SharedExpression, point=None, terms=None) -> List[str]:
+    expr = shared.expr
+    # Attempt to get an unevaluated form (this may help show some intermediate steps)
+    steps_expr = diff(expr, x, evaluate=False)
+    # After setting evaluate=False, we can apply doit(deep=False) for a somewhat intermediate form
+    intermediate = steps_expr.doit(deep=False)
+    derivative_expr = shared.derivative(1)
+
+    # Provide a descriptive, step-by-step explanation
+    return [
+        f"Original expression: {expr}",
+        "Goal: Find the derivative with respect to x.",
+        "Step 1: Identify differentiation rules needed:",
+        "  - Power Rule: d/dx[x^n] = n*x^(n-1)",
+        "  - Sum Rule: d/dx[f(x) + g(x)] = f'(x) + g'(x)",
+        "  - Product Rule: d/dx[f(x)*g(x)] = f'(x)*g(x) + f(x)*g'(x)",
+        "  - Chain Rule: d/dx[f(g(x))] = f'(g(x))*g'(x)",
+        "Step 2: Apply these rules to each term in the expression.",
+        f"Intermediate (unevaluated) derivative form: {steps_expr}",
+        f"Evaluating the intermediate expression to simplify: {intermediate}",
+        f"Final simplified derivative: {derivative_expr}"
+    ]
+
+
+def _integral_steps(shared: SharedExpression, point=None, terms=None) -> List[str]:
+    expr = shared.expr
+    integral_expr = integrate(expr, x)
+    verified = diff(integral_expr, x)
+
+    # Provide a descriptive, step-by-step explanation for integration
+    return [
+        f"Original expression: {expr}",
+        "Goal: Find the indefinite integral (antiderivative).",
+        "Step 1: Identify integration rules needed:",
+        "  - Power Rule (in reverse): ∫ x^n dx = x^(n+1)/(n+1) + C",
+        "  - For trigonometric, exponential, etc., apply known antiderivative formulas.",
+        "Step 2: Integrate each term of the expression.",
+        f"Indefinite integral: {integral_expr} + C",
+        "Step 3: Verification by differentiation:",
+        f"d/dx of {integral_expr} = {verified}, which matches the original integrand.",
+        "Thus, the computed integral is correct."
+    ]
+
+
+def _limit_steps(shared: SharedExpression, point=None, terms=None) -> List[str]:
+    expr = shared.expr
+    lim = limit(expr, x, point)
+
+    # Provide a descriptive, step-by-step explanation for limit
+    return [
+        f"Original expression: {expr}",
+        f"Goal: Find the limit as x → {point}.",
+        "Step 1: Attempt direct substitution:",
+        f"  Substitute x={point} into {expr}: {expr.subs(x, point)}",
+        "Step 2: If direct substitution is undefined or indeterminate, use limit laws, simplification, or L'Hopital's rule.",
+        "After applying the necessary limit techniques, we get:",
+        f"Limit as x → {point} = {lim}"
+    ]
+
+
+def _taylor_polynomial(shared: SharedExpression, point, terms: int):
+    """
+    Builds the Taylor polynomial from the shared derivatives, or returns None when a coefficient
+    is not finite (e.g. log(x) at 0) and a general series expansion is needed.
+    """
+    polynomial = S.Zero
+    for k in range(terms):
+        coefficient = shared.derivative(k).subs(x, point)
+        if not coefficient.is_finite:
+            return None
+        polynomial += coefficient / factorial(k) * (x - point) ** k
+    return polynomial
+
+
+def _series_steps(shared: SharedExpression, point=None, terms=None) -> List[str]:
+    expr = shared.expr
+    simplified_series = None
+    # repeated differentiation is much slower than a series expansion, so the derivatives are
+    # only used for coefficients when the batch computes them anyway
+    if terms - 1 <= shared.shared_orders:
+        simplified_series = _taylor_polynomial(shared, point, terms)
+    if simplified_series is None:
+        series_expr = expr.series(x, point, terms)
+        simplified_series = series_expr.removeO()
+
+    # Provide a descriptive, step-by-step explanation for series expansion
+    return [
+        f"Original expression: {expr}",
+        f"Goal: Find the series expansion around x = {point} up to {terms} terms.",
+        "The series expansion of a function f(x) around a point a is given by:",
+        "  f(x) = f(a) + f'(a)*(x-a) + f''(a)*(x-a)^2/2! + ...",
+        f"Computing the series expansion around a={point}, we get:",
+        f"{simplified_series}",
+        f"This polynomial (truncated series) approximates {expr} near x={point}."
+    ]
+
+
+STEPS = {
+    'derivative': _derivative_steps,
+    'integral': _integral_steps,
+    'limit': _limit_steps,
+    'series': _series_steps,
+}
+
+
+def _check_parameters(operation: str, point, terms) -> Optional[str]:
+    if operation not in STEPS:
+        return "Error: Invalid operation. Use 'derivative', 'integral', 'limit', or 'series'."
+    if operation == 'limit' and point is None:
+        return "Error: Point required for limit calculation"
+    if operation == 'series' and (point is None or terms is None):
+        return "Error: Point and terms required for series expansion"
+    return None
+
+
+def _run_operation(shared: SharedExpression, operation: str, point, terms) -> str:
+    error = _check_parameters(operation, point, terms)
+    if error:
+        return error
+    try:
+        return '\n'.join(STEPS[operation](shared, point, terms))
+    except Exception as e:
+        logging.error(f"Error running {operation} on '{shared.expr}': {str(e)}")
+        return f"Error computing {operation}: {e}"
+
+
+def _batch_pool() -> ThreadPoolExecutor:
+    global _pool, _pool_pid
+    # threads do not survive fork, so each worker process creates its own pool
+    if _pool_pid != os.getpid():
+        _pool = ThreadPoolExecutor(max_workers=BATCH_THREADS, thread_name_prefix="calc")
+        _pool_pid = os.getpid()
+    return _pool
+
+
+def _operation_list(operations, point, terms) -> List[tuple]:
+    """
+    Normalizes operations to unique (operation, point, terms) tuples. An operation may be a name,
+    which uses the batch's point and terms, or its own (operation, point, terms).
+    Raises ValueError for anything else.
+    """
+    if isinstance(operations, (str, tuple)):
+        operations = [operations]
+    if not isinstance(operations, list):
+        raise ValueError(f"Invalid operations: {operations!r}")
+    normalized = []
+    for operation in operations:
+        if isinstance(operation, str):
+            operation = (operation, point, terms)
+        if not isinstance(operation, (tuple, list)) or len(operation) != 3:
+            raise ValueError(f"Invalid operation {operation!r}: use a name or (operation, point, terms)")
+        name, op_point, op_terms = operation
+        if not isinstance(name, str):
+            raise ValueError(f"Invalid operation name: {name!r}")
+        if not isinstance(op_point, (int, float, str, type(None))) or not isinstance(op_terms, (int, type(None))):
+            raise ValueError(f"Invalid point or terms for {name}: {op_point!r}, {op_terms!r}")
+        # drop the batch's point and terms where the operation does not use them
+        if name in ('derivative', 'integral'):
+            op_point, op_terms = None, None
+        elif name == 'limit':
+            op_terms = None
+        normalized.append((name, op_point, op_terms))
+    return list(dict.fromkeys(normalized))
+
+
+def calc_solve_batch(expression: str, operations: list, point: float = None, terms: int = None) -> dict:
+    """
+    Runs several calculus operations on one expression, parsing it once and sharing intermediate
+    results (e.g. a derivative reused for low-order Taylor coefficients) between operations.
+
+    Parameters:
+    expression (str): Mathematical expression (e.g., "x^2 + sin(x)")
+    operations (list): Operations to run - 'derivative', 'integral', 'limit' or 'series', or
+        (operation, point, terms) tuples for operations with their own point and terms
+    point (float): Point for limit calculation or series expansion (default: None)
+    terms (int): Number of terms for series expansion (default: None)
+
+    Returns:
+    dict: The parsed expression and the step-by-step result of each operation, or an error
+    """
+    try:
+        expr = parse_expression(expression)
+    except Exception as e:
+        return {"expression": expression, "error": f"Error parsing expression: {e}", "results": []}
+
+    operations = _operation_list(operations, point, terms)
+    shared = SharedExpression(expr, 1 if any(operation[0] == 'derivative' for operation in operations) else 0)
+
+    def run(operation, op_point, op_terms):
+        if isinstance(op_point, str):
+            op_point = sympify(op_point)
+        return _run_operation(shared, operation, op_point, op_terms)
+
+    if len(operations) == 1:
+        texts = [run(*operations[0])]
+    else:
+        futures = [_batch_pool().submit(run, *operation) for operation in operations]
+        texts = [future.result() for future in futures]
+
+    results = [
+        {"operation": operation, "point": op_point, "terms": op_terms, "result": text}
+        for (operation, op_point, op_terms), text in zip(operations, texts)
+    ]
+    return {"expression": str(expr), "results": results}
+
+
+def format_batch_result(result: dict) -> str:
+    """
+    Combines a batch result into one block of text for the tutor prompt.
+    """
+    if "error" in result:
+        return result["error"]
+    if len(result["results"]) == 1:
+        return result["results"][0]["result"]
+    sections = [f"Results for {result['expression']}:"]
+    for entry in result["results"]:
+        label = entry["operation"] if entry["point"] is None else f"{entry['operation']} at x = {entry['point']}"
+        sections.append(f"--- {label} ---\n{entry['result']}")
+    return '\n\n'.join(sections)
+
 
 def calc_solve(expression: str, operation: str = 'derivative', point: float = None, terms: int = None) -> str:
     """
     Solves calculus problems step by step using SymPy.
-    
+
     Parameters:
     expression (str): Mathematical expression (e.g., "x^2 + sin(x)" or "3*x^2 + 2*x")
     operation (str): Type of operation - 'derivative', 'integral', 'limit', or 'series'
     point (float): Point for limit calculation or series expansion (default: None)
     terms (int): Number of terms for series expansion (default: None)
-    
+
     Returns:
     str: Step-by-step solution with explanation
     """
     # Initialize pretty printing
     init_printing()
-    
-    # Convert ^ to ** for Python syntax
-    expression = expression.replace('^', '**')
-    
-    # Parse expression
-    try:
-        expr = sympify(expression)
-    except Exception as e:
-        return f"Error parsing expression: {e}"
-
-    result = []
-    
-    if operation == 'derivative':
-        # Attempt to get an unevaluated form (this may help show some intermediate steps)
-        steps_expr = diff(expr, x, evaluate=False)
-        # After setting evaluate=False, we can apply doit(deep=False) for a somewhat intermediate form
-        intermediate = steps_expr.doit(deep=False)
-        derivative_expr = diff(expr, x)
-        
-        # Provide a descriptive, step-by-step explanation
-        result.extend([
-            f"Original expression: {expr}",
-            "Goal: Find the derivative with respect to x.",
-            "Step 1: Identify differentiation rules needed:",
-            "  - Power Rule: d/dx[x^n] = n*x^(n-1)",
-            "  - Sum Rule: d/dx[f(x) + g(x)] = f'(x) + g'(x)",
-            "  - Product Rule: d/dx[f(x)*g(x)] = f'(x)*g(x) + f(x)*g'(x)",
-            "  - Chain Rule: d/dx[f(g(x))] = f'(g(x))*g'(x)",
-            "Step 2: Apply these rules to each term in the expression.",
-            f"Intermediate (unevaluated) derivative form: {steps_expr}",
-            f"Evaluating the intermediate expression to simplify: {intermediate}",
-            f"Final simplified derivative: {derivative_expr}"
-        ])
-    
-    elif operation == 'integral':
-        integral_expr = integrate(expr, x)
-        verified = diff(integral_expr, x)
-        
-        # Provide a descriptive, step-by-step explanation for integration
-        result.extend([
-            f"Original expression: {expr}",
-            "Goal: Find the indefinite integral (antiderivative).",
-            "Step 1: Identify integration rules needed:",
-            "  - Power Rule (in reverse): ∫ x^n dx = x^(n+1)/(n+1) + C",
-            "  - For trigonometric, exponential, etc., apply known antiderivative formulas.",
-            "Step 2: Integrate each term of the expression.",
-            f"Indefinite integral: {integral_expr} + C",
-            "Step 3: Verification by differentiation:",
-            f"d/dx of {integral_expr} = {verified}, which matches the original integrand.",
-            "Thus, the computed integral is correct."
-        ])
-    
-    elif operation == 'limit':
-        if point is None:
-            return "Error: Point required for limit calculation"
-        lim = limit(expr, x, point)
-        
-        # Provide a descriptive, step-by-step explanation for limit
-        result.extend([
-            f"Original expression: {expr}",
-            f"Goal: Find the limit as x → {point}.",
-            "Step 1: Attempt direct substitution:",
-            f"  Substitute x={point} into {expr}: {expr.subs(x, point)}",
-            "Step 2: If direct substitution is undefined or indeterminate, use limit laws, simplification, or L'Hopital's rule.",
-            "After applying the necessary limit techniques, we get:",
-            f"Limit as x → {point} = {lim}"
-        ])
-    
-    elif operation == 'series':
-        if point is None or terms is None:
-            return "Error: Point and terms required for series expansion"
-        series_expr = expr.series(x, point, terms)
-        simplified_series = series_expr.removeO()
-        
-        # Provide a descriptive, step-by-step explanation for series expansion
-        result.extend([
-            f"Original expression: {expr}",
-            f"Goal: Find the series expansion around x = {point} up to {terms} terms.",
-            "The series expansion of a function f(x) around a point a is given by:",
-            "  f(x) = f(a) + f'(a)*(x-a) + f''(a)*(x-a)^2/2! + ...",
-            f"Computing the series expansion around a={point}, we get:",
-            f"{simplified_series}",
-            f"This polynomial (truncated series) approximates {expr} near x={point}."
-        ])
-    
-    else:
-        return "Error: Invalid operation. Use 'derivative', 'integral', 'limit', or 'series'."
-    
-    return '\n'.join(result)
+
+    return format_batch_result(calc_solve_batch(expression, [operation], point=point, terms=terms))
+
+
+def _extract_calls(text: str) -> List[tuple]:
+    """
+    Finds calc_solve(...) and calc_batch(...) calls in text and returns their arguments.
+    """
+    calls = []
+    for match in re.finditer(r'\b(calc_solve|calc_batch)\s*\(', text):
+        # find the matching closing parenthesis
+        depth, end = 0, None
+        for i in range(match.end() - 1, len(text)):
+            if text[i] == '(':
+                depth += 1
+            elif text[i] == ')':
+                depth -= 1
+                if depth == 0:
+                    end = i + 1
+                    break
+        if end is None:
+            continue
+        try:
+            call = ast.parse(text[match.start():end].strip(), mode='eval').body
+            args = [ast.literal_eval(arg) for arg in call.args]
+            kwargs = {kw.arg: ast.literal_eval(kw.value) for kw in call.keywords}
+        except (SyntaxError, ValueError):
+            logging.error(f"Could not parse calculator call: {text[match.start():end]}")
+            continue
+        calls.append((match.group(1), args, kwargs))
+    return calls
+
 
 def process_calc_solve(text: str) -> Optional[str]:
     """
-    Extract and execute calc_solve function calls from text.
+    Extract and execute calc_solve and calc_batch function calls from text. All calls on the same
+    expression are grouped into one batch, so it is parsed once and its derivatives are shared.
     """
-    pattern = r'calc_solve\s*\(\s*["\']([^"\']+)["\']\s*,\s*operation\s*=\s*["\']([^"\']+)["\']\s*\)'
-    matches = re.findall(pattern, text)
-    
-    if not matches:
+    batches = {}
+    for name, args, kwargs in _extract_calls(text):
+        if not args:
+            continue
+        expression = str(args[0])
+        if name == 'calc_batch':
+            operations = args[1] if len(args) > 1 else kwargs.get('operations', ['derivative'])
+        else:
+            operations = args[1] if len(args) > 1 else kwargs.get('operation', 'derivative')
+        point = args[2] if len(args) > 2 else kwargs.get('point')
+        terms = args[3] if len(args) > 3 else kwargs.get('terms')
+        try:
+            operations = _operation_list(operations, point, terms)
+        except ValueError as e:
+            logging.error(f"Skipping {name} call for expression '{expression}': {str(e)}")
+            continue
+        batches.setdefault(expression, []).extend(operations)
+
+    if not batches:
         return None
-        
+
     results = []
-    for expression, operation in matches:
+    for expression, operations in batches.items():
         try:
-            result = calc_solve(expression, operation=operation)
-            results.append(result)
+            # serve what we can from the shared cache and batch the rest
+            operations = list(dict.fromkeys(operations))
+            texts, missing = {}, []
+            for operation in operations:
+                cached = get_cached(cache_key("calc_solve", expression, *operation))
+                if cached is None:
+                    missing.append(operation)
+                else:
+                    texts[operation] = cached
+            computed = calc_solve_batch(expression, missing) if missing else {"results": []}
+            if "error" in computed:
+                results.append(computed["error"])
+                continue
+            for entry in computed["results"]:
+                operation = (entry["operation"], entry["point"], entry["terms"])
+                set_cached(cache_key("calc_solve", expression, *operation), entry["result"])
+                texts[operation] = entry["result"]
+
+            entries = []
+            for operation in operations:
+                name, point, terms = operation
+                record_event("calc_solve", {
+                    "expression": expression, "operation": name, "point": point, "terms": terms,
+                    "result": texts[operation], "cached": operation not in missing,
+                })
+                entries.append({"operation": name, "point": point, "terms": terms, "result": texts[operation]})
+            results.append(format_batch_result({"expression": computed.get("expression", expression), "results": entries}))
         except Exception as e:
             logging.error(f"Error executing calc_solve for expression '{expression}': {str(e)}")
             continue
-    
+
     return "\n\n".join(results) if results else None
 
 
-# print(process_calc_solve("""calc_solve("3*x**2 + 2*sin(x)", operation='derivative')\ncalc_solve("2*sin(x)", operation='derivative')"""))
\ No newline at end of file
+# print(process_calc_solve("""calc_solve("3*x**2 + 2*sin(x)", operation='derivative')\ncalc_solve("2*sin(x)", operation='derivative')"""))
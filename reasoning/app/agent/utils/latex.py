@@ -0,0 +1,245 @@
+from functools import lru_cache
+from typing import List
+import logging
+import re
+
+# LaTeX commands whose backslash was eaten by JSON parsing: "\frac" arrives as a form feed
+# followed by "rac", "\to" as a tab followed by "o", and so on.
+JSON_ESCAPES = [
+    (re.compile(r"\x0c(?=[A-Za-z])"), r"\\f"),
+    (re.compile(r"\x08(?=[A-Za-z])"), r"\\b"),
+    (re.compile(r"\r(?=[A-Za-z])"), r"\\r"),
+    (re.compile(r"\t(?=(?:o|imes|ext|extbf|heta|an|anh|au|ilde|frac|riangle|op|herefore)(?![A-Za-z]))"), r"\\t"),
+]
+# only inside math, and only mid-line: "a \neq b" arrives as "a " + newline + "eq b"
+NEWLINE_ESCAPE = re.compile(r"\n(?=(?:eq|e|abla|u|ot|ewline|i|mid|leq|geq|eg)(?![A-Za-z]))")
+# a real line break follows a row break, \begin{...}/\end{...} or the start of the math
+LINE_BREAK_BEFORE = re.compile(r"(?:^|\n|\\\\|\\(?:begin|end)\{[^}]*\})[ \t]*$")
+
+# "\\frac" is a line break followed by the text "frac", almost always a double-escaped "\frac"
+DOUBLE_ESCAPED_COMMAND = re.compile(
+    r"(?<!\\)\\\\(?=(?:frac|dfrac|lim|int|sum|prod|sqrt|cdot|times|to|infty|sin|cos|tan|log|ln|exp|pi|"
+    r"theta|alpha|beta|partial|quad|left|right|text|begin|end)(?![A-Za-z]))"
+)
+# a backslash with what follows it: a line break, a command, a control symbol or nothing
+LATEX_ESCAPE = re.compile(r"\\(\\|[A-Za-z]+|.|$)", re.DOTALL)
+# control symbols that are errors in math: text accents (\' \^ \~ ...) and digits. Any other
+# symbol is kept, since most are valid (\> and \: are spaces, \| is a norm, \{ a brace)
+INVALID_CONTROL_SYMBOL = re.compile(r"[0-9'`^\"~=.]")
+ENVIRONMENT = re.compile(r"\\(begin|end)\{([^}]*)\}")
+LEFT = re.compile(r"\\left(?![A-Za-z])")
+RIGHT = re.compile(r"\\right(?![A-Za-z])")
+# environments written outside $$, which remark-math leaves as plain text
+BARE_ENVIRONMENT = re.compile(r"\\begin\{([^}]*)\}.*?(?:\\end\{\1\}|$)", re.DOTALL)
+MATH_DELIMITER = re.compile(r"\\\$\$|\\\$|\$\$|\$")
+FRAGMENT_BOUNDARY = re.compile(r"\\\$\$|\\\$|\$\$|\$|\n\n")
+
+
+def _tokenize(fragment: str) -> List[list]:
+    """
+    Splits a markdown fragment into ["text" | "display" | "inline", content] tokens. Display
+    math left open is returned as an unclosed token, marked with a third element.
+    """
+    tokens = []
+    mode, start = "text", 0
+    for match in MATH_DELIMITER.finditer(fragment):
+        delimiter = match.group()
+        if delimiter == "\\$$":
+            if mode == "display":
+                # a stray backslash before the closing $$, which _fix_math removes
+                tokens.append([mode, fragment[start:match.start() + 1]])
+                mode, start = "text", match.end()
+                continue
+            # an escaped dollar followed by a single $
+            delimiter = "$"
+            match_start = match.start() + 2
+        elif delimiter == "\\$":
+            continue
+        else:
+            match_start = match.start()
+        if mode == "text":
+            tokens.append(["text", fragment[start:match_start]])
+            mode, start = ("display" if delimiter == "$$" else "inline"), match.end()
+        elif (mode == "display") == (delimiter == "$$"):
+            tokens.append([mode, fragment[start:match_start]])
+            mode, start = "text", match.end()
+    if mode == "text":
+        tokens.append(["text", fragment[start:]])
+    else:
+        tokens.append([mode, fragment[start:], "unclosed"])
+    return tokens
+
+
+def _restore_newline_escape(match) -> str:
+    # a newline that ends a row or opens the math is a real line break, not an eaten "\n"
+    if LINE_BREAK_BEFORE.search(match.string, 0, match.start()):
+        return match.group()
+    return "\\n"
+
+
+def _fix_math(math: str, fixes: list, flags: list) -> str:
+    fixed = NEWLINE_ESCAPE.sub(_restore_newline_escape, math)
+    fixed = DOUBLE_ESCAPED_COMMAND.sub(r"\\", fixed)
+    if fixed != math:
+        fixes.append("restored escaped commands")
+
+    def drop_stray(match):
+        escaped = match.group(1)
+        if escaped and not INVALID_CONTROL_SYMBOL.fullmatch(escaped):
+            return match.group()
+        fixes.append("removed stray backslash")
+        return escaped
+
+    fixed = LATEX_ESCAPE.sub(drop_stray, fixed)
+
+    # environments: drop unmatched \end, close whatever is still open
+    stack, pieces, last = [], [], 0
+    for match in ENVIRONMENT.finditer(fixed):
+        kind, name = match.groups()
+        if kind == "begin":
+            stack.append(name)
+            continue
+        if name not in stack:
+            pieces.append(fixed[last:match.start()])
+            last = match.end()
+            fixes.append(f"removed unmatched \\end{{{name}}}")
+            continue
+        while stack[-1] != name:
+            pieces.append(fixed[last:match.start()] + f"\\end{{{stack.pop()}}}")
+            last = match.start()
+            fixes.append("closed nested environment")
+        stack.pop()
+    pieces.append(fixed[last:])
+    fixed = "".join(pieces)
+
+    # braces
+    depth = 0
+    for match in re.finditer(r"\\[{}]|[{}]", fixed):
+        if match.group() == "{":
+            depth += 1
+        elif match.group() == "}":
+            depth -= 1
+            if depth < 0:
+                flags.append("unbalanced closing brace")
+                depth = 0
+    if depth:
+        fixed = fixed.rstrip() + "}" * depth
+        fixes.append("closed braces")
+
+    # \left and \right
+    lefts, rights = len(LEFT.findall(fixed)), len(RIGHT.findall(fixed))
+    if lefts > rights:
+        fixed = fixed.rstrip() + " \\right." * (lefts - rights)
+        fixes.append("closed \\left")
+    elif rights > lefts:
+        fixed = "\\left. " * (rights - lefts) + fixed
+        fixes.append("opened \\right")
+
+    if stack:
+        fixed = fixed.rstrip() + "".join(f"\n\\end{{{name}}}" for name in reversed(stack))
+        fixes.append("closed environments")
+    return fixed
+
+
+@lru_cache(maxsize=4096)
+def normalize_fragment(fragment: str) -> tuple:
+    """
+    Normalizes one markdown/LaTeX fragment. Memoized, so blocks that are unchanged between
+    turns are not checked again.
+
+    Returns:
+    tuple: (normalized fragment, fixes applied, problems that could not be fixed)
+    """
+    fixes, flags = [], []
+
+    fixed = fragment
+    for pattern, replacement in JSON_ESCAPES:
+        fixed = pattern.sub(replacement, fixed)
+    if fixed != fragment:
+        fixes.append("restored JSON-escaped commands")
+
+    out = []
+    for token in _tokenize(fixed):
+        kind, text = token[0], token[1]
+        if kind == "text":
+            if "\\begin{" in text:
+                wrapped = BARE_ENVIRONMENT.sub(lambda m: f"$${_fix_math(m.group(), fixes, flags)}$$", text)
+                if wrapped != text:
+                    fixes.append("wrapped environment in $$")
+                text = wrapped
+            out.append(text)
+            continue
+        delimiter = "$$" if kind == "display" else "$"
+        if len(token) == 3:
+            if kind == "inline":
+                # a lone $ is as likely to be a price as math
+                flags.append("unbalanced $")
+                out.append("$" + text)
+                continue
+            fixes.append("closed $$")
+        out.append(delimiter + _fix_math(text, fixes, flags) + delimiter)
+
+    remaining = re.findall(r"[\x00-\x08\x0b\x0c\x0e-\x1f]", "".join(out))
+    if remaining:
+        flags.append("control characters")
+    return "".join(out), tuple(fixes), tuple(flags)
+
+
+def _split_fragments(content: str) -> List[str]:
+    """
+    Splits content on the blank lines outside display math. Inline math never spans a blank
+    line, and display math left open ends at its first blank line, as if split there.
+    """
+    fragments, mode, start, open_blank = [], "text", 0, None
+    for match in FRAGMENT_BOUNDARY.finditer(content):
+        token = match.group()
+        if token == "\n\n":
+            if mode == "display":
+                if open_blank is None:
+                    open_blank = match.start()
+                continue
+            fragments.append(content[start:match.start()])
+            mode, start = "text", match.end()
+        elif token == "\\$":
+            continue
+        elif mode == "text":
+            mode, open_blank = ("display" if token == "$$" else "inline"), None
+        elif mode == "display" and token in ("$$", "\\$$"):
+            mode = "text"
+        elif mode == "inline" and token != "$$":
+            mode = "text"
+    if mode == "display" and open_blank is not None:
+        fragments.append(content[start:open_blank])
+        return fragments + _split_fragments(content[open_blank + 2:])
+    fragments.append(content[start:])
+    return fragments
+
+
+def normalize_whiteboard(content: str) -> tuple:
+    """
+    Normalizes whiteboard content fragment by fragment (blocks separated by blank lines).
+    """
+    fixes, flags, fragments = [], [], []
+    for fragment in _split_fragments(content):
+        fixed, fragment_fixes, fragment_flags = normalize_fragment(fragment)
+        fragments.append(fixed)
+        fixes.extend(fragment_fixes)
+        flags.extend(f"{flag}: {fragment[:80]!r}" for flag in fragment_flags)
+    return "\n\n".join(fragments), fixes, flags
+
+
+def normalize_widgets(widgets: list) -> list:
+    """
+    Validates and normalizes the content of every defineWhiteboard widget in place.
+    """
+    for widget in widgets:
+        parameters = widget.get("parameters") or {}
+        if widget.get("type") != "defineWhiteboard" or not isinstance(parameters.get("content"), str):
+            continue
+        parameters["content"], fixes, flags = normalize_whiteboard(parameters["content"])
+        if fixes:
+            logging.info(f"Normalized whiteboard LaTeX: {sorted(set(fixes))}")
+        if flags:
+            logging.warning(f"Unrenderable whiteboard fragments: {flags}")
+            widget["flagged"] = flags
+    return widgets
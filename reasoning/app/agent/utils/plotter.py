@@ -0,0 +1,241 @@
+from functools import lru_cache
+from typing import Optional
+import base64
+import json
+import logging
+
+import numpy as np
+from sympy import Symbol, diff, lambdify, sympify
+
+from .cache import cache_key, get_cached, set_cached
+
+# plotted over the reals, so that e.g. d/dx abs(x) simplifies to sign(x)
+x = Symbol("x", real=True)
+
+# Adaptive sampling settings
+INITIAL_SAMPLES = 129
+MAX_REFINEMENTS = 6
+MAX_SAMPLES = 4000
+# Refine an interval when its midpoint deviates from the chord by more than this fraction of the visible y-range
+CURVATURE_TOLERANCE = 0.002
+# A jump larger than this fraction of the visible y-range is treated as a discontinuity/asymptote
+JUMP_FRACTION = 0.5
+# Samples are sent as float32, so larger values are treated like an asymptote rather than encoded as inf
+FLOAT32_MAX = float(np.finfo(np.float32).max)
+
+
+@lru_cache(maxsize=128)
+def _compile(expression: str):
+    """
+    Parses an expression once and compiles it to a NumPy function.
+    """
+    expr = sympify(expression.replace('^', '**'), locals={"x": x})
+    f = lambdify(x, expr, modules="numpy")
+    return expr, f
+
+
+@lru_cache(maxsize=128)
+def _compile_derivative(expression: str):
+    """
+    Compiles the derivative of an expression, only when a plot needs it. The compiled function
+    is None when NumPy cannot evaluate the derivative (e.g. floor(x)).
+    """
+    expr, _ = _compile(expression)
+    derivative_expr = diff(expr, x)
+    try:
+        df = lambdify(x, derivative_expr, modules="numpy")
+    except Exception as e:
+        logging.warning(f"Cannot compile the derivative of '{expression}': {str(e)}")
+        df = None
+    return derivative_expr, df
+
+
+def _evaluate(f, xs: np.ndarray) -> np.ndarray:
+    """
+    Evaluates a compiled function on an array, mapping complex, invalid or float32-overflowing
+    values to NaN.
+    """
+    with np.errstate(all="ignore"):
+        ys = np.asarray(f(xs))
+    if ys.shape != xs.shape:
+        # constant expressions compile to a scalar
+        ys = np.broadcast_to(ys, xs.shape)
+    if np.iscomplexobj(ys):
+        ys = np.where(np.abs(ys.imag) < 1e-12, ys.real, np.nan)
+    ys = ys.astype(np.float64)
+    with np.errstate(invalid="ignore"):
+        return np.where(np.abs(ys) > FLOAT32_MAX, np.nan, ys)
+
+
+def _visible_range(ys: np.ndarray) -> float:
+    """
+    Robust y-range of the finite samples, ignoring the spikes next to asymptotes.
+    """
+    finite = ys[np.isfinite(ys)]
+    if finite.size == 0:
+        return 1.0
+    low, high = np.percentile(finite, [2, 98])
+    return max(float(high - low), 1e-9)
+
+
+def _adaptive_sample(f, x_min: float, x_max: float):
+    """
+    Samples f on [x_min, x_max], refining intervals of high curvature and splitting
+    the curve into continuous segments at discontinuities and asymptotes.
+    """
+    xs = np.linspace(x_min, x_max, INITIAL_SAMPLES)
+    ys = _evaluate(f, xs)
+    scale = _visible_range(ys)
+
+    for _ in range(MAX_REFINEMENTS):
+        mids = (xs[:-1] + xs[1:]) / 2
+        mid_ys = _evaluate(f, mids)
+        chord = (ys[:-1] + ys[1:]) / 2
+        with np.errstate(invalid="ignore"):
+            bent = np.abs(mid_ys - chord) > CURVATURE_TOLERANCE * scale
+        # intervals where the function enters or leaves its domain also need refining
+        edge = np.isfinite(ys[:-1]) != np.isfinite(ys[1:])
+        refine = bent | edge
+        if not refine.any() or xs.size + refine.sum() > MAX_SAMPLES:
+            break
+        xs = np.concatenate([xs, mids[refine]])
+        ys = np.concatenate([ys, mid_ys[refine]])
+        order = np.argsort(xs, kind="stable")
+        xs, ys = xs[order], ys[order]
+
+    # split at non-finite values and at jumps the refinement could not close
+    finite = np.isfinite(ys)
+    with np.errstate(invalid="ignore"):
+        jumps = np.abs(np.diff(ys)) > JUMP_FRACTION * scale
+    breaks = jumps | ~finite[:-1] | ~finite[1:]
+    segments = []
+    for seg_x, seg_y in zip(np.split(xs, np.flatnonzero(breaks) + 1), np.split(ys, np.flatnonzero(breaks) + 1)):
+        keep = np.isfinite(seg_y)
+        if keep.sum() > 1:
+            segments.append((seg_x[keep], seg_y[keep]))
+    return tuple(segments)
+
+
+def _encode(values: np.ndarray) -> str:
+    """
+    Packs an array as base64 little-endian float32 for a compact JSON payload.
+    """
+    return base64.b64encode(np.asarray(values, dtype="<f4").tobytes()).decode("ascii")
+
+
+def _encode_segments(segments) -> list:
+    return [{"x": _encode(seg_x), "y": _encode(seg_y), "n": int(seg_x.size)} for seg_x, seg_y in segments]
+
+
+def _y_range(segments) -> list:
+    all_ys = np.concatenate([seg_y for _, seg_y in segments]) if segments else np.array([])
+    if not all_ys.size:
+        return [-1.0, 1.0]
+    low, high = np.percentile(all_ys, [2, 98])
+    pad = max(float(high - low), 1.0) * 0.1
+    return [float(low) - pad, float(high) + pad]
+
+
+def _sample(expression: str, x_min: float, x_max: float, derivative: bool = False) -> Optional[dict]:
+    """
+    Encoded sample set of an expression (or its derivative) over a domain, with the expression
+    and y-range it spans, or None when the derivative cannot be evaluated. Sample sets are kept
+    in the shared cache, since any worker or calculation process may get the same plot.
+    """
+    key = cache_key("plot_samples", expression, x_min, x_max, derivative)
+    cached = get_cached(key)
+    if cached is not None:
+        return json.loads(cached)
+
+    expr, f = _compile_derivative(expression) if derivative else _compile(expression)
+    if f is None:
+        samples = None
+    else:
+        segments = _adaptive_sample(f, x_min, x_max)
+        samples = {"expression": str(expr), "yRange": _y_range(segments), "segments": _encode_segments(segments)}
+    set_cached(key, json.dumps(samples))
+    return samples
+
+
+def plot_function(expression: str, x_min: float = -10, x_max: float = 10, show_derivative: bool = False,
+                  tangent_at: Optional[float] = None, area_from: Optional[float] = None,
+                  area_to: Optional[float] = None) -> dict:
+    """
+    Samples a function for the plotFunction widget.
+
+    Parameters:
+    expression (str): Mathematical expression in x (e.g., "x^2 + sin(x)")
+    x_min (float): Left edge of the plotted domain
+    x_max (float): Right edge of the plotted domain
+    show_derivative (bool): Whether to include samples of f'(x)
+    tangent_at (float): Point at which to draw the tangent line (default: None)
+    area_from (float): Lower bound of the shaded area under the curve (default: None)
+    area_to (float): Upper bound of the shaded area under the curve (default: None)
+
+    Returns:
+    dict: Widget data with curves as segments of base64 float32 arrays
+    """
+    x_min, x_max = round(float(x_min), 6), round(float(x_max), 6)
+    if x_min >= x_max:
+        raise ValueError(f"Invalid domain [{x_min}, {x_max}]")
+
+    samples = _sample(expression, x_min, x_max)
+    data = {
+        "expression": samples["expression"],
+        "domain": [x_min, x_max],
+        "yRange": samples["yRange"],
+        "f": samples["segments"],
+    }
+
+    if show_derivative:
+        derivative_samples = _sample(expression, x_min, x_max, derivative=True)
+        if derivative_samples is not None:
+            data["derivativeExpression"] = derivative_samples["expression"]
+            data["df"] = derivative_samples["segments"]
+
+    # tangents and areas are cheap and depend on more than the domain, so they are not cached
+    df = _compile_derivative(expression)[1] if tangent_at is not None else None
+    if df is not None:
+        x0 = float(tangent_at)
+        y0 = float(_evaluate(_compile(expression)[1], np.array([x0]))[0])
+        slope = float(_evaluate(df, np.array([x0]))[0])
+        if np.isfinite(y0) and np.isfinite(slope):
+            data["tangent"] = {"x0": x0, "y0": y0, "slope": slope}
+
+    if area_from is not None and area_to is not None:
+        a, b = sorted((float(area_from), float(area_to)))
+        area_x = np.linspace(a, b, 257)
+        area_y = _evaluate(_compile(expression)[1], area_x)
+        if np.isfinite(area_y).all():
+            data["area"] = {
+                "x": _encode(area_x),
+                "y": _encode(area_y),
+                "n": int(area_x.size),
+                "value": float(np.sum((area_y[1:] + area_y[:-1]) * np.diff(area_x)) / 2),
+            }
+
+    return data
+
+
+def render_plot_widgets(widgets: list) -> list:
+    """
+    Fills in sampled data for every plotFunction widget emitted by the tutor.
+    """
+    for widget in widgets:
+        if widget.get("type") != "plotFunction":
+            continue
+        parameters = widget.get("parameters", {})
+        try:
+            widget["data"] = plot_function(
+                parameters["expression"],
+                x_min=parameters.get("xMin", -10),
+                x_max=parameters.get("xMax", 10),
+                show_derivative=parameters.get("showDerivative", False),
+                tangent_at=parameters.get("tangentAt"),
+                area_from=parameters.get("areaFrom"),
+                area_to=parameters.get("areaTo"),
+            )
+        except Exception as e:
+            logging.error(f"Error plotting expression '{parameters.get('expression')}': {str(e)}")
+            widget["data"] = None
+    return widgets
@@ -0,0 +1,186 @@
+"""
+Overload benchmark for the degradation tiers.
+
+Drives run_agent with open-loop arrivals at 1x and 3x of the simulated provider's capacity,
+with degradation enabled and disabled, and reports goodput (turns completed within the
+deadline per second), latency, turns that failed and the tiers that were used.
+
+The LLM is simulated: a provider that serves a fixed number of calls concurrently and takes
+a fixed overhead plus a per-output-token time, so queueing and the token caps behave like
+they do against a real rate-limited endpoint. Output is cut off at max_tokens like a real
+completion, so a capped answer that does not fit fails the turn.
+
+    python benchmark_overload.py --duration 20
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import statistics
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+# thresholds scaled to the simulated provider, unless overridden
+os.environ.setdefault("DEGRADE_QUEUE_DEPTHS", "6,10,14,18")
+os.environ.setdefault("DEGRADE_LLM_LATENCY_MS", "1500,2500,3500,4500")
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+os.environ.setdefault("LLM_MODEL_ID", "benchmark")
+os.environ.setdefault("LLM_API_KEY", "benchmark")
+os.environ.pop("REASONING_RECORD_DIR", None)
+os.environ["TIER_METRICS_ENABLED"] = "false"
+
+from agent import executor
+from agent.load import load_monitor
+from agent.prompts import estimate_tokens
+from agent.utils import cache
+from stubs import StubLLMClient, install
+
+PROVIDER_CONCURRENCY = 4
+CALL_OVERHEAD_S = 0.05
+SECONDS_PER_TOKEN = 0.0005
+# full whiteboard answer, answer when asked to fit the token cap, speech-only answer
+TUTOR_OUTPUT_TOKENS = 1200
+BRIEF_OUTPUT_TOKENS = 700
+SPEECH_OUTPUT_TOKENS = 80
+CONTEXT_OUTPUT_TOKENS = 60
+# mostly distinct questions, so the response cache only helps with genuine repeats
+QUESTIONS = [f"Can you explain topic number {i} in calculus?" for i in range(1000)]
+CAP_TOKENS_MARKER = executor.CAP_TOKENS_INSTRUCTION.split("{")[0]
+
+
+def tutor_response(tokens: int) -> str:
+    """
+    A tutor answer whose JSON is about the given number of tokens long.
+    """
+    empty = {"widgets": [{"type": "defineWhiteboard", "parameters": {"content": ""}}], "response": "Here is how that works."}
+    padding = max(0, tokens - estimate_tokens(json.dumps(empty)))
+    empty["widgets"][0]["parameters"]["content"] = "### Notes\n\n" + "$$f'(x) = 2x$$ " * (padding * 4 // 15)
+    return json.dumps(empty)
+
+
+class SimulatedLLMClient(StubLLMClient):
+    """
+    A provider with limited concurrency whose latency grows with the output tokens allowed.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.slots = threading.BoundedSemaphore(PROVIDER_CONCURRENCY)
+
+    def complete(self, messages, max_tokens, **kwargs) -> tuple:
+        if "response_format" not in kwargs:
+            # the context agent, which asks for no calculation
+            content, tokens = "", min(max_tokens, CONTEXT_OUTPUT_TOKENS)
+        else:
+            # the tutor, which follows the per-turn instructions the executor appends
+            instructions = messages[-1]["content"] if messages[-1]["role"] == "system" else ""
+            if executor.SPEECH_ONLY_INSTRUCTION in instructions:
+                content = tutor_response(SPEECH_OUTPUT_TOKENS)
+            elif CAP_TOKENS_MARKER in instructions:
+                content = tutor_response(BRIEF_OUTPUT_TOKENS)
+            else:
+                content = tutor_response(TUTOR_OUTPUT_TOKENS)
+            tokens = estimate_tokens(content)
+
+        finish_reason = "stop"
+        if tokens > max_tokens:
+            content, tokens, finish_reason = content[:4 * max_tokens], max_tokens, "length"
+        with self.slots:
+            time.sleep(CALL_OVERHEAD_S + tokens * SECONDS_PER_TOKEN)
+        return content, finish_reason
+
+
+install(SimulatedLLMClient())
+
+
+def normal_turn_seconds() -> float:
+    return 2 * CALL_OVERHEAD_S + (TUTOR_OUTPUT_TOKENS + CONTEXT_OUTPUT_TOKENS) * SECONDS_PER_TOKEN
+
+
+async def one_turn(deadline: float, tiers: Counter):
+    """
+    Returns the turn latency, or None if it missed the deadline or ended without a response.
+    """
+    input_dict = {
+        "messages": [{"role": "user", "content": random.choice(QUESTIONS)}],
+        "session": {"id": random.randrange(1_000_000)},
+        "task_id": "",
+    }
+
+    async def consume() -> bool:
+        responded = False
+        async for output in executor.run_agent(input_dict):
+            event = json.loads(output)
+            if event["node"] == "CustomerResponse":
+                tiers[event["degradation"]] += 1
+                responded = True
+        if not responded:
+            tiers["failed"] += 1
+        return responded
+
+    start = time.perf_counter()
+    try:
+        responded = await asyncio.wait_for(consume(), timeout=deadline)
+    except asyncio.TimeoutError:
+        return None
+    return time.perf_counter() - start if responded else None
+
+
+async def run_scenario(load_factor: float, duration: float, degradation: bool) -> dict:
+    load_monitor.enabled = degradation
+    load_monitor.llm_latency_ms = 0.0
+    cache._local.clear()
+    loop = asyncio.get_running_loop()
+    # enough threads that the simulated provider, not the thread pool, is the bottleneck
+    loop.set_default_executor(ThreadPoolExecutor(max_workers=512))
+
+    capacity = PROVIDER_CONCURRENCY / normal_turn_seconds()
+    rate = capacity * load_factor
+    deadline = 8 * normal_turn_seconds()
+    tiers = Counter()
+    tasks = []
+    start = time.perf_counter()
+    while time.perf_counter() - start < duration:
+        tasks.append(asyncio.create_task(one_turn(deadline, tiers)))
+        await asyncio.sleep(random.expovariate(rate))
+    latencies = await asyncio.gather(*tasks)
+
+    completed = sorted(latency for latency in latencies if latency is not None)
+    failed = tiers.pop("failed", 0)
+    elapsed = time.perf_counter() - start
+    return {
+        "load": f"{load_factor:g}x",
+        "degradation": "on" if degradation else "off",
+        "offered": len(tasks) / duration,
+        "goodput": len(completed) / elapsed,
+        "p50": statistics.median(completed) if completed else float("nan"),
+        "p95": completed[int(0.95 * (len(completed) - 1))] if completed else float("nan"),
+        "failed": failed,
+        "timeouts": len(tasks) - len(completed) - failed,
+        "tiers": dict(tiers),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark throughput under overload.")
+    parser.add_argument("--duration", type=float, default=20, help="seconds of arrivals per scenario")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    random.seed(args.seed)
+
+    print(f"Simulated capacity: {PROVIDER_CONCURRENCY / normal_turn_seconds():.1f} turns/s at normal tier\n")
+    print(f"{'load':<6}{'degrade':<9}{'offered/s':>10}{'goodput/s':>11}{'p50 s':>8}{'p95 s':>8}{'timeouts':>10}{'failed':>8}  tiers")
+    for load_factor in (1, 3):
+        for degradation in (False, True):
+            result = asyncio.run(run_scenario(load_factor, args.duration, degradation))
+            print(
+                f"{result['load']:<6}{result['degradation']:<9}{result['offered']:>10.1f}{result['goodput']:>11.1f}"
+                f"{result['p50']:>8.2f}{result['p95']:>8.2f}{result['timeouts']:>10}{result['failed']:>8}  {result['tiers']}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+import gc
+import os
+import signal
+
+# Multi-worker serving for the reasoning agent:
+#   gunicorn -c gunicorn.conf.py main:app
+# The app (SymPy, NumPy, LLM clients) is imported once in the master and warmed up before the
+# workers are forked, so every worker shares those pages copy-on-write. Heavy SymPy/NumPy work
+# runs in a pool of calculation processes shared by all workers (agent/calc_pool.py).
+
+
+def _cpu_limit() -> int:
+    """
+    CPUs available to this container: its cgroup CPU quota if it has one, otherwise the CPUs this
+    process may run on. multiprocessing.cpu_count() reports the host's cores inside a container.
+    """
+    quota_files = [
+        ("/sys/fs/cgroup/cpu.max", None),
+        ("/sys/fs/cgroup/cpu/cpu.cfs_quota_us", "/sys/fs/cgroup/cpu/cpu.cfs_period_us"),
+    ]
+    for quota_file, period_file in quota_files:
+        try:
+            with open(quota_file) as f:
+                values = f.read().split()
+            if period_file:
+                with open(period_file) as f:
+                    values.append(f.read().strip())
+            quota, period = values[0], values[1]
+            if quota not in ("max", "-1"):
+                return max(1, int(quota) // int(period))
+        except (OSError, ValueError, IndexError):
+            continue
+    return len(os.sched_getaffinity(0))
+
+
+bind = f"0.0.0.0:{os.getenv('REASONING_PORT', '8003')}"
+worker_class = "uvicorn.workers.UvicornWorker"
+# Workers mostly wait on the LLM, so a few are enough; calculations get their own processes
+workers = int(os.getenv("REASONING_WORKERS", min(_cpu_limit(), 4)))
+calc_processes = int(os.getenv("REASONING_CALC_PROCESSES", min(_cpu_limit(), 4)))
+preload_app = True
+
+# Turns stream for as long as the LLM takes, so only kill workers that are truly stuck
+timeout = int(os.getenv("REASONING_WORKER_TIMEOUT", 120))
+# On SIGTERM/SIGHUP workers stop accepting and get this long to finish in-flight turns
+graceful_timeout = int(os.getenv("REASONING_GRACEFUL_TIMEOUT", 30))
+keepalive = 5
+
+# Recycle workers periodically (staggered) to bound memory growth from SymPy's caches
+max_requests = int(os.getenv("REASONING_MAX_REQUESTS", 2000))
+max_requests_jitter = max_requests // 10
+
+
+def when_ready(server):
+    """
+    Runs in the master after the app is preloaded and before the first fork.
+    """
+    from agent.utils.calculator import calc_solve
+    from agent.utils.plotter import plot_function
+
+    # warm SymPy's caches and the lambdify/NumPy code paths
+    calc_solve("x**2*sin(x)", operation="derivative")
+    calc_solve("x*exp(x)", operation="integral")
+    calc_solve("sin(x)/x", operation="limit", point=0)
+    calc_solve("exp(x)", operation="series", point=0, terms=4)
+    plot_function("x**2", -1, 1, show_derivative=True)
+
+    # keep the warmed objects out of the collector so its bookkeeping does not unshare their pages
+    gc.freeze()
+
+    if calc_processes > 0:
+        from agent.calc_pool import start_pool
+        server.calc_pool_pid = start_pool(calc_processes)
+    server.log.info(f"Reasoning app warmed up, forking {workers} workers and {calc_processes} calculation processes")
+
+
+def on_exit(server):
+    pid = getattr(server, "calc_pool_pid", None)
+    if pid:
+        try:
+            os.kill(pid, signal.SIGTERM)
+        except ProcessLookupError:
+            pass
+
@@ -0,0 +1,171 @@
+"""
+Replays turns recorded with REASONING_RECORD_DIR through the executor, with the LLM
+swapped for the recorded completions, and reports per-stage timing deltas.
+
+    python replay.py recordings/*.jsonl --jobs 4 --output results-feature.jsonl
+    python replay.py recordings/*.jsonl --baseline results-main.jsonl
+
+Without --baseline, replayed timings are compared against the timings in the recording. Replay
+answers LLM calls instantly, so that comparison leaves out the LLM stages and first_response, and
+compares the total net of LLM time ("total-llm"). Use --baseline to compare every stage.
+"""
+import argparse
+import asyncio
+import collections
+import contextvars
+import copy
+import json
+import os
+import statistics
+from concurrent.futures import ProcessPoolExecutor
+
+# replay never records itself, never hits the real LLM and always recomputes calculations
+os.environ.pop("REASONING_RECORD_DIR", None)
+os.environ["SHARED_CACHE_ENABLED"] = "false"
+os.environ["TIER_METRICS_ENABLED"] = "false"
+os.environ.setdefault("LLM_MODEL_ID", "replay")
+os.environ.setdefault("LLM_API_KEY", "replay")
+
+from agent import executor
+from agent.load import TIER_NAMES, forced_tier_var
+from agent.recorder import new_turn_record, read_turns, turn_record_var
+from stubs import StubLLMClient, install
+
+_recorded_completions = contextvars.ContextVar("recorded_completions")
+
+LLM_STAGES = ("context_llm", "tutor_llm")
+
+
+class ReplayLLMClient(StubLLMClient):
+    """
+    Returns the current turn's recorded completions in order.
+    """
+
+    def complete(self, **kwargs) -> tuple:
+        completion = _recorded_completions.get().popleft()
+        return completion["content"], completion.get("finish_reason", "stop")
+
+
+install(ReplayLLMClient())
+
+
+def turn_key(turn: dict) -> str:
+    return f"{turn['recorded_at']}:{turn['task_id']}"
+
+
+async def replay_turn(turn: dict) -> dict:
+    record = new_turn_record(turn["messages"], turn["session"], turn["task_id"])
+    turn_record_var.set(record)
+    _recorded_completions.set(collections.deque(turn["completions"]))
+    # run the pipeline the turn was recorded under, whatever the load during replay
+    forced_tier_var.set(TIER_NAMES.index(turn.get("degradation", "normal")))
+
+    events = 0
+    input_dict = {
+        "messages": copy.deepcopy(turn["messages"]),
+        "session": copy.deepcopy(turn["session"]),
+        "task_id": turn["task_id"],
+    }
+    async for _ in executor.run_agent(input_dict):
+        events += 1
+
+    recorded_results = [call["result"] for call in turn["calc_solve"]]
+    replayed_results = [call["result"] for call in record["calc_solve"]]
+    return {
+        "key": turn_key(turn),
+        "events": events,
+        "calc_mismatch": recorded_results != replayed_results,
+        "recorded": turn["timings"],
+        "replayed": record["timings"],
+    }
+
+
+async def replay_all(turns: list, concurrency: int) -> list:
+    slots = asyncio.Semaphore(concurrency)
+
+    async def bounded(turn):
+        async with slots:
+            return await replay_turn(turn)
+
+    return await asyncio.gather(*(bounded(turn) for turn in turns))
+
+
+def replay_shard(turns: list, concurrency: int) -> list:
+    return asyncio.run(replay_all(turns, concurrency))
+
+
+def percentile(values: list, q: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+def without_llm(timings: dict) -> dict:
+    """
+    Timings that can be compared with a recording made against the real LLM.
+    """
+    comparable = {name: value for name, value in timings.items() if name not in LLM_STAGES + ("first_response", "total")}
+    if "total" in timings:
+        comparable["total-llm"] = timings["total"] - sum(timings.get(name, 0.0) for name in LLM_STAGES)
+    return comparable
+
+
+def summarize(results: list, baseline: dict):
+    pairs_by_stage = collections.defaultdict(list)
+    for result in results:
+        if result["key"] in baseline:
+            reference, replayed = baseline[result["key"]], result["replayed"]
+        else:
+            reference, replayed = without_llm(result["recorded"]), without_llm(result["replayed"])
+        for name, value in replayed.items():
+            if name in reference:
+                pairs_by_stage[name].append((reference[name], value))
+
+    print(f"{'stage':<14}{'turns':>7}{'base p50':>11}{'new p50':>11}{'Δ p50':>10}{'base mean':>11}{'new mean':>11}{'Δ mean':>10}")
+    for name, pairs in sorted(pairs_by_stage.items()):
+        base = [b for b, _ in pairs]
+        new = [n for _, n in pairs]
+        base_p50, new_p50 = percentile(base, 0.5), percentile(new, 0.5)
+        base_mean, new_mean = statistics.mean(base), statistics.mean(new)
+        print(
+            f"{name:<14}{len(pairs):>7}{base_p50:>11.1f}{new_p50:>11.1f}{new_p50 - base_p50:>+10.1f}"
+            f"{base_mean:>11.1f}{new_mean:>11.1f}{new_mean - base_mean:>+10.1f}"
+        )
+    if any(result["key"] not in baseline for result in results):
+        print("(turns without a baseline are compared with the recording, without LLM stages and first_response)")
+    mismatches = sum(result["calc_mismatch"] for result in results)
+    print(f"\n{len(results)} turns replayed (ms), {mismatches} with calc_solve results that differ from the recording")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay recorded reasoning turns.")
+    parser.add_argument("recordings", nargs="+", help="JSONL files written with REASONING_RECORD_DIR")
+    parser.add_argument("--jobs", type=int, default=os.cpu_count(), help="worker processes")
+    parser.add_argument("--concurrency", type=int, default=8, help="concurrent turns per process")
+    parser.add_argument("--output", help="write per-turn replay timings to this JSONL file")
+    parser.add_argument("--baseline", help="per-turn replay timings from another code version")
+    args = parser.parse_args()
+
+    turns = list(read_turns(args.recordings))
+    if not turns:
+        print("No recorded turns found.")
+        return
+
+    jobs = max(1, min(args.jobs, len(turns)))
+    shards = [turns[i::jobs] for i in range(jobs)]
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        results = [r for shard in pool.map(replay_shard, shards, [args.concurrency] * jobs) for r in shard]
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            for result in results:
+                f.write(json.dumps(result) + "\n")
+
+    baseline = {}
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = {r["key"]: r["replayed"] for r in map(json.loads, filter(str.strip, f))}
+    summarize(results, baseline)
+
+
+if __name__ == "__main__":
+    main()
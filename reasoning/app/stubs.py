@@ -0,0 +1,43 @@
+"""
+Stand-ins for the LLM client and Redis, shared by the offline tools (replay.py and
+benchmark_overload.py). Import it after the tools have set up the environment, since it
+imports the executor.
+"""
+from types import SimpleNamespace
+
+from agent import executor
+
+
+class StubLLMClient:
+    """
+    Stands in for the LLM client. Subclasses implement complete(), which receives the
+    arguments of chat.completions.create and returns the content and finish reason.
+    """
+
+    def __init__(self):
+        self.chat = SimpleNamespace(completions=self)
+
+    def complete(self, **kwargs) -> tuple:
+        raise NotImplementedError
+
+    def create(self, **kwargs):
+        content, finish_reason = self.complete(**kwargs)
+        message = SimpleNamespace(content=content)
+        return SimpleNamespace(choices=[SimpleNamespace(message=message, finish_reason=finish_reason)])
+
+
+class NoCancelRedis:
+    """
+    Turns run offline are never cancelled.
+    """
+
+    async def get(self, key):
+        return None
+
+
+def install(llm_client: StubLLMClient):
+    """
+    Points the executor at the stub LLM client and at a Redis on which no turn is cancelled.
+    """
+    executor.client = llm_client
+    executor.redis_client = NoCancelRedis()
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# the service runs from reasoning/app, which is where its top-level imports resolve
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app"))
@@ -0,0 +1,142 @@
+import pytest
+
+from agent.recorder import new_turn_record, turn_record_var
+from agent.utils import calculator
+from agent.utils.calculator import _operation_list, calc_solve, calc_solve_batch, process_calc_solve
+
+DERIVATIVE_STEPS = (
+    "Original expression: x**2 + sin(x)\n"
+    "Goal: Find the derivative with respect to x.\n"
+    "Step 1: Identify differentiation rules needed:\n"
+    "  - Power Rule: d/dx[x^n] = n*x^(n-1)\n"
+    "  - Sum Rule: d/dx[f(x) + g(x)] = f'(x) + g'(x)\n"
+    "  - Product Rule: d/dx[f(x)*g(x)] = f'(x)*g(x) + f(x)*g'(x)\n"
+    "  - Chain Rule: d/dx[f(g(x))] = f'(g(x))*g'(x)\n"
+    "Step 2: Apply these rules to each term in the expression.\n"
+    "Intermediate (unevaluated) derivative form: Derivative(x**2 + sin(x), x)\n"
+    "Evaluating the intermediate expression to simplify: 2*x + cos(x)\n"
+    "Final simplified derivative: 2*x + cos(x)"
+)
+
+LIMIT_STEPS = (
+    "Original expression: sin(x)/x\n"
+    "Goal: Find the limit as x → 0.\n"
+    "Step 1: Attempt direct substitution:\n"
+    "  Substitute x=0 into sin(x)/x: nan\n"
+    "Step 2: If direct substitution is undefined or indeterminate, use limit laws, simplification, or L'Hopital's rule.\n"
+    "After applying the necessary limit techniques, we get:\n"
+    "Limit as x → 0 = 1"
+)
+
+SERIES_STEPS = (
+    "Original expression: exp(x)\n"
+    "Goal: Find the series expansion around x = 0 up to 4 terms.\n"
+    "The series expansion of a function f(x) around a point a is given by:\n"
+    "  f(x) = f(a) + f'(a)*(x-a) + f''(a)*(x-a)^2/2! + ...\n"
+    "Computing the series expansion around a=0, we get:\n"
+    "x**3/6 + x**2/2 + x + 1\n"
+    "This polynomial (truncated series) approximates exp(x) near x=0."
+)
+
+
+@pytest.fixture
+def cache(monkeypatch):
+    """
+    Replaces the shared cache with a dict, so tests neither need nor touch Redis.
+    """
+    store = {}
+    monkeypatch.setattr(calculator, "get_cached", store.get)
+    monkeypatch.setattr(calculator, "set_cached", store.__setitem__)
+    return store
+
+
+@pytest.fixture
+def record():
+    record = new_turn_record([], {}, "")
+    token = turn_record_var.set(record)
+    yield record
+    turn_record_var.reset(token)
+
+
+@pytest.fixture
+def batches(monkeypatch):
+    """
+    Records the operations of every calc_solve_batch call.
+    """
+    calls = []
+
+    def counting_batch(expression, operations, point=None, terms=None):
+        calls.append((expression, list(operations)))
+        return calc_solve_batch(expression, operations, point=point, terms=terms)
+
+    monkeypatch.setattr(calculator, "calc_solve_batch", counting_batch)
+    return calls
+
+
+def test_calc_solve_text_is_unchanged():
+    assert calc_solve("x^2 + sin(x)") == DERIVATIVE_STEPS
+    assert calc_solve("sin(x)/x", "limit", 0) == LIMIT_STEPS
+    assert calc_solve("exp(x)", "series", 0, 4) == SERIES_STEPS
+
+
+def test_calc_solve_reports_missing_parameters():
+    assert calc_solve("x", "limit") == "Error: Point required for limit calculation"
+    assert calc_solve("x", "series", 0) == "Error: Point and terms required for series expansion"
+    assert calc_solve("x", "product").startswith("Error: Invalid operation")
+
+
+def test_series_shares_derivative_only_for_low_orders():
+    batch = calc_solve_batch("exp(x)", ["derivative", "series"], point=0, terms=2)
+    assert batch["results"][1]["result"].split("\n")[5] == "x + 1"
+    # higher orders come from a series expansion, with the same text as on its own
+    batch = calc_solve_batch("exp(x)", ["derivative", "series"], point=0, terms=4)
+    assert batch["results"][1]["result"] == SERIES_STEPS
+
+
+def test_operation_list_normalizes_names_and_tuples():
+    assert _operation_list("integral", 0, 4) == [("integral", None, None)]
+    assert _operation_list(["limit", "series", ("limit", 1, None), "limit"], 0, 4) == [
+        ("limit", 0, None), ("series", 0, 4), ("limit", 1, None),
+    ]
+
+
+@pytest.mark.parametrize("operations, point", [
+    ([["limit", 0]], None),
+    ("limit", [0]),
+    ([("series", 0, "four")], None),
+    ({"limit": 0}, None),
+])
+def test_operation_list_rejects_malformed_operations(operations, point):
+    with pytest.raises(ValueError):
+        _operation_list(operations, point, None)
+
+
+def test_groups_calls_by_expression(cache, record, batches):
+    text = (
+        'calc_solve("exp(x)", operation="derivative")\n'
+        'calc_solve("exp(x)", "series", 0, 4)\n'
+        'calc_batch("exp(x)", operations=["derivative", "limit"], point=0)\n'
+        'calc_solve("x^2 + sin(x)")'
+    )
+    result = process_calc_solve(text)
+
+    assert batches == [
+        ("exp(x)", [("derivative", None, None), ("series", 0, 4), ("limit", 0, None)]),
+        ("x^2 + sin(x)", [("derivative", None, None)]),
+    ]
+    assert result.endswith(DERIVATIVE_STEPS)
+    assert "--- series at x = 0 ---\n" + SERIES_STEPS in result
+    assert [event["operation"] for event in record["calc_solve"]] == ["derivative", "series", "limit", "derivative"]
+
+
+def test_serves_repeated_operations_from_cache(cache, record, batches):
+    process_calc_solve('calc_solve("exp(x)", "series", 0, 4)')
+    process_calc_solve('calc_batch("exp(x)", ["series", "derivative"], 0, 4)')
+
+    assert batches == [("exp(x)", [("series", 0, 4)]), ("exp(x)", [("derivative", None, None)])]
+    assert [event["cached"] for event in record["calc_solve"]] == [False, True, False]
+
+
+def test_malformed_call_does_not_drop_the_others(cache, record):
+    text = 'calc_batch("sin(x)", operations=[["limit", 0]]) calc_solve("x^2", "limit", [0]) calc_solve("x^2 + sin(x)")'
+    assert process_calc_solve(text) == DERIVATIVE_STEPS
@@ -0,0 +1,96 @@
+import pytest
+
+from agent.utils.latex import normalize_fragment, normalize_whiteboard, normalize_widgets
+
+
+def test_valid_latex_is_unchanged():
+    content = "### Derivative\n\n$$f'(x) = 2x + \\cos(x)$$\n\nSo the slope at $x = 0$ is $1$."
+    assert normalize_whiteboard(content) == (content, [], [])
+
+
+def test_restores_json_escaped_commands():
+    fixed, fixes, _ = normalize_fragment("$$\x0crac{1}{2} \to 0$$")
+    assert fixed == "$$\\frac{1}{2} \\to 0$$"
+    assert "restored JSON-escaped commands" in fixes
+
+
+def test_restores_eaten_newline_escape_mid_line():
+    fixed, _, _ = normalize_fragment("$$a \neq b$$")
+    assert fixed == "$$a \\neq b$$"
+
+
+def test_keeps_line_breaks_in_environments():
+    content = "$$\\begin{align*}\nu &= x^2 \\\\\ndu &= 2x\\,dx \\\\\ne^x &= 1\n\\end{align*}$$"
+    assert normalize_whiteboard(content)[0] == content
+
+
+def test_keeps_line_break_at_start_of_math():
+    assert normalize_fragment("$$\nu = 3\n$$")[0] == "$$\nu = 3\n$$"
+
+
+def test_restores_double_escaped_commands():
+    assert normalize_fragment("$$\\\\frac{a}{b}$$")[0] == "$$\\frac{a}{b}$$"
+
+
+def test_removes_stray_backslash():
+    fixed, fixes, _ = normalize_fragment("$$x \\^ 2$$")
+    assert fixed == "$$x ^ 2$$"
+    assert "removed stray backslash" in fixes
+
+
+@pytest.mark.parametrize("math", ["$$a \\> b$$", "$$a \\: b \\; c \\! d$$", "$$\\|v\\| = \\{1\\}$$", "$$a\\ b \\\\ c$$"])
+def test_keeps_valid_control_symbols(math):
+    assert normalize_fragment(math) == (math, (), ())
+
+
+def test_removes_backslash_before_digit():
+    assert normalize_fragment("$$x^\\2$$")[0] == "$$x^2$$"
+
+
+def test_closes_braces_and_left():
+    assert normalize_fragment("$$\\frac{1}{2$$")[0] == "$$\\frac{1}{2}$$"
+    assert normalize_fragment("$$\\left( x + 1$$")[0] == "$$\\left( x + 1 \\right.$$"
+
+
+def test_closes_environment_and_display_math():
+    fixed, fixes, _ = normalize_fragment("$$\\begin{aligned} x &= 1")
+    assert fixed == "$$\\begin{aligned} x &= 1\n\\end{aligned}$$"
+    assert "closed $$" in fixes
+
+
+def test_wraps_bare_environment():
+    fixed, _, _ = normalize_fragment("\\begin{aligned} x &= 1 \\end{aligned}")
+    assert fixed == "$$\\begin{aligned} x &= 1 \\end{aligned}$$"
+
+
+def test_flags_lone_dollar():
+    fixed, _, flags = normalize_fragment("It costs $5")
+    assert fixed == "It costs $5"
+    assert flags == ("unbalanced $",)
+
+
+def test_display_math_with_blank_line_stays_one_block():
+    content = "$$x^2\n\n+1$$"
+    assert normalize_whiteboard(content) == (content, [], [])
+
+
+def test_lone_dollar_does_not_pair_across_blank_line():
+    fixed, _, flags = normalize_whiteboard("It costs $5\n\nand $x$ is math")
+    assert fixed == "It costs $5\n\nand $x$ is math"
+    assert len(flags) == 1
+
+
+def test_unclosed_display_math_ends_at_blank_line():
+    fixed, fixes, _ = normalize_whiteboard("$$x^2\n\nSome text")
+    assert fixed == "$$x^2$$\n\nSome text"
+    assert "closed $$" in fixes
+
+
+def test_normalize_widgets_only_touches_whiteboards():
+    widgets = [
+        {"type": "defineWhiteboard", "parameters": {"content": "$$\x0crac{1}{2}$$"}},
+        {"type": "plotFunction", "parameters": {"expression": "x^2"}},
+    ]
+    normalize_widgets(widgets)
+    assert widgets[0]["parameters"]["content"] == "$$\\frac{1}{2}$$"
+    assert widgets[1]["parameters"] == {"expression": "x^2"}